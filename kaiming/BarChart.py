@@ -1,6 +1,8 @@
 import math
 import numpy as np
 from matplotlib.ticker import AutoMinorLocator
+from matplotlib.path import Path
+from matplotlib.patches import PathPatch
 
 def point_to_inch(point):
     return float(point) / 72.0
@@ -60,6 +62,9 @@ class BarChart:
         self.barwidth = 0.4
         self.linewidth = 0.8
         self.legends = []
+        # from this many bars per layer on, plot() draws a layer as one
+        # compound PathPatch instead of one Rectangle per bar
+        self.bulk_min_bars = 200
 
     def plot(self, databars, xformat, yformat, ax, **kwargs):
         num_bars = len(databars)
@@ -89,10 +94,35 @@ class BarChart:
             shift_base = 0
         for i in range(0, num_bars):
             shift = (i - int(num_bars / 2)) * (self.barwidth + point_to_inch(self.linewidth)) + shift_base
-            for j in range(0, len(databars[i].data)):
-                if j == 0:
-                    self.legends.append(ax.bar(np.arange(len(databars[i].data[j])) + shift, databars[i].data[j], width = self.barwidth, align="center", linewidth = self.linewidth, label = databars[i].barlabel[j], hatch = get_default_hatches(self.bar_cnt), color = "w", edgecolor=get_default_colors(self.bar_cnt)))
+            # layers x categories; every layer starts on top of all the ones below
+            stack = np.array(databars[i].data, dtype = np.float64)
+            bottoms = np.cumsum(stack, axis = 0) - stack
+            xvalues = np.arange(stack.shape[1]) + shift
+            for j in range(0, len(stack)):
+                if len(xvalues) >= self.bulk_min_bars:
+                    self.legends.append(self.plot_bulk(ax, xvalues, stack[j], bottoms[j], databars[i].barlabel[j], get_default_hatches(self.bar_cnt), get_default_colors(self.bar_cnt)))
                 else:
-                    self.legends.append(ax.bar(np.arange(len(databars[i].data[j])) + shift, databars[i].data[j], width = self.barwidth, align="center", linewidth = self.linewidth, label = databars[i].barlabel[j], hatch = get_default_hatches(self.bar_cnt), color = "w", edgecolor=get_default_colors(self.bar_cnt), bottom = databars[i].data[j - 1]))
+                    self.legends.append(ax.bar(xvalues, stack[j], width = self.barwidth, align="center", linewidth = self.linewidth, label = databars[i].barlabel[j], hatch = get_default_hatches(self.bar_cnt), color = "w", edgecolor=get_default_colors(self.bar_cnt), bottom = bottoms[j]))
                 self.bar_cnt += 1
-        return self.legends
\ No newline at end of file
+        return self.legends
+
+    def plot_bulk(self, ax, xvalues, heights, bottoms, label, hatch, edgecolor):
+        # the rectangles ax.bar(align = "center") would draw, as the subpaths
+        # of a single path. One path (rather than a PolyCollection of many)
+        # also keeps the legend's "best" placement search vectorised.
+        left = xvalues - self.barwidth / 2.0
+        right = left + self.barwidth
+        tops = bottoms + heights
+        verts = np.empty((len(xvalues), 5, 2))
+        verts[:, :, 0] = np.column_stack((left, left, right, right, left))
+        verts[:, :, 1] = np.column_stack((bottoms, tops, tops, bottoms, bottoms))
+        codes = np.tile([Path.MOVETO, Path.LINETO, Path.LINETO, Path.LINETO, Path.CLOSEPOLY], len(xvalues))
+        bars = PathPatch(Path(verts.reshape(-1, 2), codes), facecolor = "w", edgecolor = edgecolor, linewidth = self.linewidth, hatch = hatch, label = label)
+        # like ax.bar, do not add a margin below the bottom of the bars
+        bars.sticky_edges.y.extend(np.unique(bottoms))
+        # add_patch would walk the path segment by segment to update the data
+        # limits; the corners are known already
+        ax.add_artist(bars)
+        ax.update_datalim(verts[:, :4].reshape(-1, 2))
+        ax.autoscale_view()
+        return bars
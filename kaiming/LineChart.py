@@ -1,5 +1,12 @@
 import math
+import numpy as np
+import matplotlib
 from matplotlib.ticker import AutoMinorLocator
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from matplotlib.legend import Legend
+from matplotlib.legend_handler import HandlerLine2D
+from matplotlib.markers import MarkerStyle
 
 # def get_color_list():
 #     colors = []
@@ -45,11 +52,52 @@ def get_default_markers(index):
     markers.append("d")
     return markers[index % len(markers)]
 
+def minmax_decimate(values, max_points):
+    # indices of the points to keep so that each of max_points / 2 equal
+    # columns keeps its minimum and maximum: the envelope a plot shows at
+    # that resolution is preserved
+    values = np.asarray(values, dtype = np.float64)
+    num_values = len(values)
+    if num_values <= max_points:
+        return np.arange(num_values)
+    width = -(-num_values // max(max_points // 2, 1))
+    num_columns = -(-num_values // width)
+    columns = np.full(num_columns * width, np.nan)
+    columns[:num_values] = values
+    columns = columns.reshape(num_columns, width)
+    starts = np.arange(num_columns) * width
+    lows = np.argmin(np.where(np.isnan(columns), np.inf, columns), axis = 1) + starts
+    highs = np.argmax(np.where(np.isnan(columns), -np.inf, columns), axis = 1) + starts
+    keep = np.unique(np.concatenate((lows, highs, [0, num_values - 1])))
+    return keep[keep < num_values]
+
 class LineData:
     def __init__(self, data, linelabel):
         self.data = data
         self.linelabel = linelabel
 
+class LegendProxy:
+    # legend handle of a line drawn in bulk; its Line2D is only built when
+    # a legend actually lays the entry out
+    def __init__(self, label, color, marker, linewidth, markersize):
+        self.label = label
+        self.color = color
+        self.marker = marker
+        self.linewidth = linewidth
+        self.markersize = markersize
+
+    def get_label(self):
+        return self.label
+
+    def create_handle(self):
+        return Line2D([], [], label = self.label, color = self.color, marker = self.marker, linewidth = self.linewidth, markersize = self.markersize)
+
+class HandlerLegendProxy(HandlerLine2D):
+    def legend_artist(self, legend, orig_handle, fontsize, handlebox):
+        return HandlerLine2D.legend_artist(self, legend, orig_handle.create_handle(), fontsize, handlebox)
+
+Legend.update_default_handler_map({LegendProxy: HandlerLegendProxy()})
+
 class LineChart:
     def plot(self, datalines, xformat, yformat, ax):
         # set x axis
@@ -78,11 +126,59 @@ class LineChart:
         if yformat.min_value != yformat.max_value:
             ax.set_ylim(yformat.min_value, yformat.max_value)
 
+        if len(datalines) >= self.bulk_min_lines:
+            self.plot_bulk(datalines, ax)
+            return self.legends
+
         for i in range(0, len(datalines)):
-            self.legends.append(ax.plot(datalines[i].data, label = datalines[i].linelabel, marker = get_default_markers(self.linecnt), linewidth = self.linewidth, markersize = self.markersize, color = get_default_colors(self.linecnt))[0])
+            xvalues, yvalues = self.decimate(datalines[i].data)
+            self.legends.append(ax.plot(xvalues, yvalues, label = datalines[i].linelabel, marker = get_default_markers(self.linecnt), linewidth = self.linewidth, markersize = self.markersize, color = get_default_colors(self.linecnt))[0])
             self.linecnt += 1
         return self.legends
 
+    def decimate(self, data):
+        # (x, y) of a line, reduced to about max_points points if set
+        if self.max_points == None or len(data) <= self.max_points:
+            return np.arange(len(data)), data
+        keep = minmax_decimate(data, self.max_points)
+        self.points_dropped += len(data) - len(keep)
+        return keep, np.asarray(data)[keep]
+
+    def plot_bulk(self, datalines, ax):
+        # all lines in one LineCollection and the markers in one scatter per
+        # marker style, instead of one Line2D per line
+        num_lines = len(datalines)
+        lines_xy = [self.decimate(line.data) for line in datalines]
+        num_points = max([len(xvalues) for xvalues, yvalues in lines_xy])
+        # lines x points x (x, y), shorter lines padded with nan
+        segments = np.full((num_lines, num_points, 2), np.nan)
+        for i in range(0, num_lines):
+            xvalues, yvalues = lines_xy[i]
+            segments[i, :len(xvalues), 0] = xvalues
+            segments[i, :len(yvalues), 1] = yvalues
+        segments[np.isnan(segments[:, :, 1]), 0] = np.nan
+
+        indices = range(self.linecnt, self.linecnt + num_lines)
+        colors = np.array([matplotlib.colors.to_rgba(get_default_colors(i)) for i in indices])
+        markers = [get_default_markers(i) for i in indices]
+        lines = LineCollection(segments, colors = colors, linewidths = self.linewidth, capstyle = matplotlib.rcParams["lines.solid_capstyle"], joinstyle = matplotlib.rcParams["lines.solid_joinstyle"], zorder = 2)
+        ax.add_collection(lines, autolim = True)
+
+        for marker in sorted(set(markers)):
+            selected = [i for i in range(0, num_lines) if markers[i] == marker]
+            points = segments[selected].reshape(-1, 2)
+            point_colors = np.repeat(colors[selected], num_points, axis = 0)
+            valid = ~np.isnan(points[:, 1])
+            kwargs = {}
+            if MarkerStyle(marker).is_filled():
+                kwargs["edgecolors"] = point_colors[valid]
+            ax.scatter(points[valid, 0], points[valid, 1], s = self.markersize ** 2, c = point_colors[valid], marker = marker, linewidths = matplotlib.rcParams["lines.markeredgewidth"], zorder = 2, **kwargs)
+        ax.autoscale_view()
+
+        for i in range(0, num_lines):
+            self.legends.append(LegendProxy(datalines[i].linelabel, colors[i], markers[i], self.linewidth, self.markersize))
+        self.linecnt += num_lines
+
     def __init__(self):
         # init line style
         self.linecnt = 0
@@ -91,6 +187,8 @@ class LineChart:
         self.grid_linewidth = 0.2
         self.grid_dashes = (0.5, 0.5)
         self.legends = []
-
-
-    
\ No newline at end of file
+        # from this many lines on, plot() draws them in bulk
+        self.bulk_min_lines = 200
+        # longer lines are decimated to about max_points points (None: never)
+        self.max_points = None
+        self.points_dropped = 0
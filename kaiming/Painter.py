@@ -1,19 +1,30 @@
+import io
+import os
 import sys
+import copy
+import json
+import time
+import hashlib
+import functools
+import multiprocessing
 import numpy as np
 import matplotlib.pyplot as pyplot
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from LineChart import LineChart
 from LineChart import LineData
+from LineChart import LegendProxy
 from BarChart import BarChart
 from BarChart import BarData
+from RenderCache import RenderCache
+from SpecTokenizer import tokenize
+from SpecTokenizer import raw_commands
+from SpecTokenizer import sidecar_path
+from SpecTokenizer import convert_to_sidecar
 
 
 def clean_head_tail_line(strline):
-    while strline != "" and (strline[0] == "\t" or strline[0] == " "):
-        strline = strline[1:]
-
-    while strline != "" and (strline[-1] == "\n" or strline[-1] == "\t" or strline[-1] == " "):
-        strline = strline[:-1]
-    return strline
+    return strline.lstrip("\t ").rstrip("\n\t ")
 
 def get_default_fontsize():
     return 6.5
@@ -60,13 +71,53 @@ class AxisFormat:
                 self.label_on = value
         return
 
+class ChartSpec:
+    # the chart a spec asks for; the LineChart/BarChart is only built at render
+    def __init__(self, chart_type):
+        self.chart_type = chart_type
+        self.barwidth = None
+
+    def create(self):
+        if self.chart_type == "LineChart":
+            chart = LineChart()
+        else:
+            chart = BarChart()
+        if self.barwidth != None:
+            chart.barwidth = self.barwidth
+        return chart
+
+class Panel:
+    # everything one spec file of a chain contributes to the figure
+    def __init__(self, positions, chart, title, xformat, yformat, legend_ncol, data, transition, max_points):
+        # positions : [(x, y, index), ... ] subplots selected by the file
+        self.positions = positions
+        # chart : ChartSpec, shared by the files of a "ysecondary" chain
+        self.chart = chart
+        self.title = title
+        self.xformat = xformat
+        self.yformat = yformat
+        self.legend_ncol = legend_ncol
+        # data : [LineData, ... ] | [BarData, ... ]
+        self.data = data
+        # transition : "next" | "ysecondary" | None, how the chain goes on
+        self.transition = transition
+        # max_points : decimate longer lines to about this many points | None
+        self.max_points = max_points
+
 class Painter:
+    # version of the compiled spec format written by save_ir
+    ir_version = 3
+
     def __init__(self, inputfile, outputfile, **kargs):
         self.figsize = (5.7, 3.5)
-        self.figure = pyplot.figure(figsize=self.figsize, dpi = 160, facecolor = 'w', edgecolor = 'k')
-        self.ax = pyplot.gca()
+        self.use_pyplot = True
+        self.ir_cachedir = None
         self.paint_funcs = {}
         self.legend_ncol = 2
+        # max_points : decimation of every line, over the specs' "decimate"
+        self.max_points = None
+        # decimate : the "decimate" of the spec being parsed
+        self.decimate = None
         self.legend_border_width = 0.0
         self.setup_paint_funcs()
         self.outputfile = outputfile
@@ -81,77 +132,84 @@ class Painter:
         for key, value in kargs.items():
             if key == "delimiter":
                 self.delimiter = value
-
-        self.parse_inputfile(inputfile)
-
-    def set_xtick(self):
-        self.xformat.tick_label = clean_head_tail_line(self.file.readline()).split(self.delimiter)
-    def set_xlabel(self):
-        self.xformat.axis_label = clean_head_tail_line(self.file.readline())
-    def set_ylabel(self):
-        self.yformat.axis_label = clean_head_tail_line(self.file.readline())
-    def set_ylim(self):
-        ylim = [int(y) for y in clean_head_tail_line(self.file.readline()).split(self.delimiter)]
+            elif key == "use_pyplot":
+                self.use_pyplot = value
+            elif key == "ir_cachedir":
+                self.ir_cachedir = value
+            elif key == "max_points":
+                self.max_points = value
+
+        if self.ir_cachedir != None:
+            self.compile_cached(inputfile)
+        else:
+            self.parse_inputfile(inputfile)
+
+        if self.use_pyplot:
+            self.figure = pyplot.figure(figsize=self.figsize, dpi = 160, facecolor = 'w', edgecolor = 'k')
+        else:
+            # no figure manager and no pyplot global state: Painters created
+            # this way can render concurrently, e.g. from a thread pool
+            self.figure = Figure(figsize=self.figsize, dpi = 160, facecolor = 'w', edgecolor = 'k')
+            FigureCanvasAgg(self.figure)
+        self.ax = self.figure.gca()
+
+        self.render()
+
+    def set_xtick(self, tick_label):
+        self.xformat.tick_label = tick_label
+    def set_xlabel(self, label):
+        self.xformat.axis_label = label
+    def set_ylabel(self, label):
+        self.yformat.axis_label = label
+    def set_ylim(self, ylim):
         self.yformat.min_value = ylim[0]
         self.yformat.max_value = ylim[1]
-    def assign_title(self):
-        self.title = clean_head_tail_line(self.file.readline())
-    def assign_position(self):
-        # x, y, index
-        pos = [int(n) for n in clean_head_tail_line(self.file.readline()).split(self.delimiter)]
-        if pos[0] != 1 or pos[1] != 1:
-            pyplot.subplot(pos[0], pos[1], pos[2])
-        self.ax = pyplot.gca()
+    def assign_title(self, title):
+        self.title = title
+    def assign_position(self, pos):
+        self.positions.append(pos)
 
-    def set_figsize(self):
-        self.figsize = (float(v) for v in clean_head_tail_line(self.file.readline()).split(self.delimiter))
-        self.figure.set_size_inches(self.figsize)
+    def set_figsize(self, figsize):
+        self.figsize = figsize
 
-    def set_legend_ncol(self):
-        self.legend_ncol = int(clean_head_tail_line(self.file.readline()))
+    def set_legend_ncol(self, ncol):
+        self.legend_ncol = ncol
 
-    def create_chart(self):
-        self.chart_type = clean_head_tail_line(self.file.readline())
+    def set_decimate(self, max_points):
+        self.decimate = max_points
+
+    def create_chart(self, chart_type):
+        self.chart_type = chart_type
         if self.chart_type == "LineChart":
-            self.chart = LineChart()
+            self.chart = ChartSpec(self.chart_type)
         elif self.chart_type == "BarChart":
             self.xformat.grid_on = False
-            self.chart = BarChart()
+            self.chart = ChartSpec(self.chart_type)
 
-    def add_line(self):
-        linelabel = clean_head_tail_line(self.file.readline())
-        data = [float(x) for x in clean_head_tail_line(self.file.readline()).split(self.delimiter)]
+    def add_line(self, linelabel, data):
         line = LineData(data, linelabel)
         self.data.append(line)
 
-    def add_bar(self):
-        barlabel = [clean_head_tail_line(self.file.readline())]
-        data = [[float(x) for x in clean_head_tail_line(self.file.readline()).split(self.delimiter)]]
+    def add_bar(self, barlabel, data):
         bar = BarData(data, barlabel)
         self.data.append(bar)
 
-    def add_stackbar(self):
-        barlabel = []
-        data = []
-        num_stack = int(clean_head_tail_line(self.file.readline()))
-        for i in range(0, num_stack):
-            barlabel.append(clean_head_tail_line(self.file.readline()))
-            data.append([float(x) for x in clean_head_tail_line(self.file.readline()).split(self.delimiter)])
+    def add_stackbar(self, barlabel, data):
         bar = BarData(data, barlabel)
         self.data.append(bar)
 
-    def set_barwidth(self):
+    def set_barwidth(self, barwidth):
         if self.chart == None:
             self.xformat.grid_on = False
-            self.chart = BarChart()
-        self.chart.barwidth = float(clean_head_tail_line(self.file.readline()))
+            self.chart = ChartSpec("BarChart")
+        self.chart.barwidth = barwidth
 
-    def set_ysecondary(self):
-        self.ysecondary = clean_head_tail_line(self.file.readline())
-    def set_next(self):
-        self.next = clean_head_tail_line(self.file.readline())
-    def set_yscale(self):
-        self.yformat.scale = clean_head_tail_line(self.file.readline())
+    def set_ysecondary(self, filename):
+        self.ysecondary = filename
+    def set_next(self, filename):
+        self.next = filename
+    def set_yscale(self, scale):
+        self.yformat.scale = scale
 
     def setup_paint_funcs(self):
         self.paint_funcs["xticks"] = self.set_xtick
@@ -168,6 +226,7 @@ class Painter:
         self.paint_funcs["line"] = self.add_line
         self.paint_funcs["chart"] = self.create_chart
         self.paint_funcs["legend_ncol"] = self.set_legend_ncol
+        self.paint_funcs["decimate"] = self.set_decimate
 
         self.paint_funcs["position"] = self.assign_position
         self.paint_funcs["figsize"] = self.set_figsize
@@ -176,63 +235,350 @@ class Painter:
         self.paint_funcs["next"] = self.set_next
 
     def show_legends(self, legends, ax):
+        # bulk-drawn lines whose label starts with "_" get no legend entry, so
+        # their LegendProxy is never materialized; other artists are listed
+        # as they are
+        legends = [lgd for lgd in legends if not (isinstance(lgd, LegendProxy) and lgd.get_label().startswith("_"))]
         labels = [lgd.get_label() for lgd in legends]
         ax.legend(legends, labels, loc='best', fancybox=True, fontsize = 1.2 * get_default_fontsize(), ncol = self.legend_ncol, framealpha=1).get_frame().set_linewidth(0.0)
     def parse_inputfile(self, inputfile):
+        # compile the spec chain into self.panels; nothing is drawn yet
+        self.panels = []
         filename = inputfile
         while True:
             # initialize
             self.data = []
-            self.file = open(filename, "r")
-            while True:
-                command = clean_head_tail_line(self.file.readline())
-                if command != "":
-                    self.paint_funcs[command]()
-                else:
-                    break
+            self.positions = []
+            for command in tokenize(filename, self.delimiter):
+                self.paint_funcs[command.name](*command.args)
 
-            # plot figure
-            if self.title != None:
-                self.ax.set_title(self.title)
-            self.legends = self.legends + self.chart.plot(self.data, self.xformat, self.yformat, self.ax)
-        
-            # release obj
-            self.file.close()
+            panel = Panel(self.positions, self.chart, self.title, copy.copy(self.xformat), copy.copy(self.yformat), self.legend_ncol, self.data, None, self.decimate)
+            self.panels.append(panel)
 
             if self.next != None:
+                panel.transition = "next"
                 filename = self.next
-                del self.xformat
-                del self.yformat
-                del self.chart
                 self.xformat = AxisFormat(minorticks_on=False)
                 self.yformat = AxisFormat(minorticks_on=True)
-                self.show_legends(self.legends, self.ax)
-                self.legends = []
                 self.next = None
                 self.chart = None
                 self.title = None
             elif self.ysecondary != None:
+                panel.transition = "ysecondary"
                 filename = self.ysecondary
-                del self.yformat
-                self.ax = self.ax.twinx()
                 self.yformat = AxisFormat(minorticks_on=True)
                 self.ysecondary = None
                 self.title = None
             else:
                 break
+
+    def subplot(self, pos):
+        # x, y, index
+        if pos[0] != 1 or pos[1] != 1:
+            if self.use_pyplot:
+                pyplot.subplot(pos[0], pos[1], pos[2])
+            else:
+                self.figure.add_subplot(pos[0], pos[1], pos[2])
+        self.ax = self.figure.gca()
+
+    def render(self):
+        charts = {}
+        for panel in self.panels:
+            for pos in panel.positions:
+                self.subplot(pos)
+            if not id(panel.chart) in charts:
+                charts[id(panel.chart)] = panel.chart.create()
+            chart = charts[id(panel.chart)]
+            self.legend_ncol = panel.legend_ncol
+            if isinstance(chart, LineChart):
+                # the Painter argument is applied here, not stored in the
+                # panels, so that a cached IR does not depend on it
+                chart.max_points = self.max_points if self.max_points != None else panel.max_points
+
+            # plot figure
+            if panel.title != None:
+                self.ax.set_title(panel.title)
+            self.legends = self.legends + chart.plot(panel.data, panel.xformat, panel.yformat, self.ax)
+
+            if panel.transition == "next":
+                self.show_legends(self.legends, self.ax)
+                self.legends = []
+            elif panel.transition == "ysecondary":
+                self.ax = self.ax.twinx()
         self.show_legends(self.legends, self.ax)
 
+        points_dropped = sum([chart.points_dropped for chart in charts.values() if isinstance(chart, LineChart)])
+        if points_dropped > 0:
+            sys.stderr.write("%s: decimation dropped %d points\n" % (self.outputfile, points_dropped))
+
+    def save_ir(self, irfile, files):
+        # the compiled panels go to an uncompressed npz: series as arrays,
+        # everything else as a json header
+        arrays = {}
+        def add_array(values):
+            name = "a" + str(len(arrays))
+            arrays[name] = np.asarray(values, dtype = np.float64)
+            return name
+
+        charts = []
+        panels = []
+        for panel in self.panels:
+            if panel.chart != None and not panel.chart in charts:
+                charts.append(panel.chart)
+            data = []
+            for series in panel.data:
+                if isinstance(series, LineData):
+                    data.append({"line": series.linelabel, "array": add_array(series.data)})
+                else:
+                    data.append({"bar": series.barlabel, "arrays": [add_array(values) for values in series.data]})
+            panels.append({
+                "positions": panel.positions,
+                "chart": charts.index(panel.chart) if panel.chart != None else None,
+                "title": panel.title,
+                "xformat": vars(panel.xformat),
+                "yformat": vars(panel.yformat),
+                "legend_ncol": panel.legend_ncol,
+                "max_points": panel.max_points,
+                "data": data,
+                "transition": panel.transition})
+        header = {
+            "version": Painter.ir_version,
+            "delimiter": self.delimiter,
+            "files": files,
+            "figsize": list(self.figsize),
+            "charts": [vars(chart) for chart in charts],
+            "panels": panels}
+        arrays["header"] = np.frombuffer(json.dumps(header).encode(), dtype = np.uint8)
+        tmpfile = irfile + ".tmp" + str(os.getpid()) + ".npz"
+        np.savez(tmpfile, **arrays)
+        os.replace(tmpfile, irfile)
+
+    def load_ir(self, irfile):
+        # returns False if irfile is missing or any file it was compiled from
+        # has changed since
+        if not os.path.isfile(irfile):
+            return False
+        with np.load(irfile, allow_pickle = False) as archive:
+            header = json.loads(archive["header"].tobytes().decode())
+            if header["version"] != Painter.ir_version or header["delimiter"] != self.delimiter:
+                return False
+            for filename, size, mtime in header["files"]:
+                if not os.path.isfile(filename):
+                    return False
+                stat = os.stat(filename)
+                if stat.st_size != size or stat.st_mtime_ns != mtime:
+                    return False
+            charts = []
+            for values in header["charts"]:
+                chart = ChartSpec(values["chart_type"])
+                chart.barwidth = values["barwidth"]
+                charts.append(chart)
+            self.panels = []
+            for values in header["panels"]:
+                xformat = AxisFormat()
+                xformat.__dict__.update(values["xformat"])
+                yformat = AxisFormat()
+                yformat.__dict__.update(values["yformat"])
+                data = []
+                for series in values["data"]:
+                    if "line" in series:
+                        data.append(LineData(archive[series["array"]], series["line"]))
+                    else:
+                        data.append(BarData([archive[name] for name in series["arrays"]], series["bar"]))
+                chart = charts[values["chart"]] if values["chart"] != None else None
+                self.panels.append(Panel(values["positions"], chart, values["title"], xformat, yformat, values["legend_ncol"], data, values["transition"], values["max_points"]))
+            self.figsize = tuple(header["figsize"])
+        return True
+
+    def compile_cached(self, inputfile):
+        # reuse the compiled spec chain from ir_cachedir when none of its files
+        # changed (same size and mtime, like .pyc files); otherwise parse it
+        # and store the result
+        name = hashlib.sha256((os.path.abspath(inputfile) + "\n" + self.delimiter).encode()).hexdigest()
+        irfile = os.path.join(self.ir_cachedir, name + ".ir.npz")
+        if not self.load_ir(irfile):
+            # stat before parsing, so an edit made meanwhile is not missed
+            files = []
+            for filename in spec_chain(inputfile):
+                stat = os.stat(filename)
+                files.append([os.path.abspath(filename), stat.st_size, stat.st_mtime_ns])
+            self.parse_inputfile(inputfile)
+            os.makedirs(self.ir_cachedir, exist_ok = True)
+            self.save_ir(irfile, files)
+
     def print_figure(self):
-        pyplot.savefig(self.outputfile + ".pdf", bbox_inches='tight', pad_inches = cm2in(0.1), dpi = 160, transparent = True)
-        pyplot.close(self.figure)
+        self.figure.savefig(self.outputfile + ".pdf", bbox_inches='tight', pad_inches = cm2in(0.1), dpi = 160, transparent = True)
+        if self.use_pyplot:
+            pyplot.close(self.figure)
+
+
+def spec_chain(inputfile):
+    # every spec file parse_inputfile reads for inputfile, found by following
+    # "next" and "ysecondary" the same way it does, plus the sidecars they use
+    files = []
+    filename = inputfile
+    next_file = None
+    ysecondary = None
+    while True:
+        files.append(filename)
+        for command, args in raw_commands(filename):
+            if command == "next":
+                next_file = args[0]
+            elif command == "ysecondary":
+                ysecondary = args[0]
+            elif command == "line" or command == "bar" or command == "stackbar":
+                for row in (args[2::2] if command == "stackbar" else args[1:]):
+                    sidecar = sidecar_path(row, filename)
+                    if sidecar != None and not sidecar in files:
+                        files.append(sidecar)
+
+        if next_file != None:
+            filename = next_file
+            next_file = None
+        elif ysecondary != None:
+            filename = ysecondary
+            ysecondary = None
+        else:
+            break
+    return files
+
+def style_sources():
+    # the default styles live in the code, so changing it invalidates the cache
+    import LineChart
+    import BarChart
+    return [os.path.abspath(__file__), os.path.abspath(LineChart.__file__), os.path.abspath(BarChart.__file__)]
+
+def read_manifest(manifest, outputdir):
+    # manifest is either a directory (every file in it is a spec) or a text
+    # file with one "inputfile [outputfile]" entry per line
+    jobs = []
+    if os.path.isdir(manifest):
+        for name in sorted(os.listdir(manifest)):
+            inputfile = os.path.join(manifest, name)
+            if name[0] != "." and os.path.isfile(inputfile):
+                jobs.append((inputfile, os.path.join(outputdir, os.path.splitext(name)[0])))
+        return jobs
+
+    with open(manifest, "r") as f:
+        for line in f:
+            line = clean_head_tail_line(line)
+            if line == "" or line[0] == "#":
+                continue
+            fields = line.split()
+            if len(fields) == 1:
+                outputfile = os.path.join(outputdir, os.path.splitext(os.path.basename(fields[0]))[0])
+            else:
+                outputfile = os.path.join(outputdir, fields[1])
+            jobs.append((fields[0], outputfile))
+    return jobs
+
+def render_one(job, **kargs):
+    # returns (inputfile, outputfile, seconds, error message or None)
+    inputfile, outputfile = job
+    start = time.perf_counter()
+    try:
+        painter = Painter(inputfile, outputfile, use_pyplot = False, **kargs)
+        painter.print_figure()
+    except Exception as e:
+        return (inputfile, outputfile, time.perf_counter() - start, "%s: %s" % (type(e).__name__, e))
+    return (inputfile, outputfile, time.perf_counter() - start, None)
+
+def report_result(index, total, result):
+    inputfile, outputfile, seconds, error = result
+    if error is None:
+        sys.stdout.write("[%d/%d] %s -> %s.pdf %.3f s\n" % (index + 1, total, inputfile, outputfile, seconds))
+    else:
+        sys.stderr.write("[%d/%d] %s failed after %.3f s: %s\n" % (index + 1, total, inputfile, seconds, error))
+
+def init_worker():
+    # warm up matplotlib once per worker process (pdf backend, font cache) so
+    # that the first figure of every worker does not pay for it
+    figure = Figure(figsize = (1, 1))
+    FigureCanvasAgg(figure)
+    figure.gca().plot([0, 1], label = "warmup")
+    figure.savefig(io.BytesIO(), format = "pdf")
+
+def render_batch(jobs, njobs = 1, cache = None, **kargs):
+    # render every (inputfile, outputfile) job in this interpreter, so that
+    # matplotlib, the backend and the font cache are only loaded once. With
+    # njobs > 1 the jobs are spread over a pool of worker processes; results
+    # are still reported in job order. With a RenderCache, jobs whose spec
+    # chain is unchanged are copied from the cache instead of rendered.
+    # Other keyword arguments are handed to every Painter.
+    start = time.perf_counter()
+    results = [None for job in jobs]
+    keys = [None for job in jobs]
+    pending = []
+    if cache != None:
+        sources = style_sources()
+        # every Painter argument that can change the picture is part of the
+        # key; where the compiled specs are cached cannot
+        style = dict([(name, value) for name, value in kargs.items() if name != "ir_cachedir"])
+        for i in range(0, len(jobs)):
+            inputfile, outputfile = jobs[i]
+            try:
+                keys[i] = cache.key(spec_chain(inputfile), sources, **style)
+            except Exception:
+                # let the render report what is wrong with the spec
+                pending.append(i)
+                continue
+            if cache.fetch(keys[i], outputfile + ".pdf"):
+                results[i] = (inputfile, outputfile, 0.0, None)
+                sys.stdout.write("[%d/%d] %s -> %s.pdf cached\n" % (i + 1, len(jobs), inputfile, outputfile))
+            else:
+                pending.append(i)
+    else:
+        pending = list(range(0, len(jobs)))
+
+    def finish(i, result):
+        report_result(i, len(jobs), result)
+        results[i] = result
+        if keys[i] != None and result[3] is None:
+            cache.store(keys[i], result[1] + ".pdf")
+
+    pending_jobs = [jobs[i] for i in pending]
+    if njobs > 1:
+        with multiprocessing.Pool(njobs, initializer = init_worker) as pool:
+            for i, result in zip(pending, pool.imap(functools.partial(render_one, **kargs), pending_jobs, chunksize = 1)):
+                finish(i, result)
+    else:
+        for i, job in zip(pending, pending_jobs):
+            finish(i, render_one(job, **kargs))
+    elapsed = time.perf_counter() - start
 
+    nfailed = len([result for result in results if result[3] is not None])
+    rate = len(results) / elapsed if elapsed > 0 else 0.0
+    sys.stdout.write("rendered %d figures (%d failed) in %.2f s, %.1f figures/s\n" % (len(results) - nfailed, nfailed, elapsed, rate))
+    if cache != None:
+        sys.stdout.write(cache.report() + "\n")
+    return results
 
 def help():
     print("Usage: python3 Painter.py inputfile outputfile")
+    print("       python3 Painter.py --batch manifest|specdir outputdir [--jobs N] [--cache cachedir] [--cache-size MB] [--ir-cache irdir]")
+    print("       python3 Painter.py --to-sidecar inputfile outputfile [min_points]")
 
 if __name__ == "__main__":
     if sys.argv[1] == "help" or sys.argv[1] == "--help":
         help()
+    elif sys.argv[1] == "--batch":
+        assert len(sys.argv) >= 4 and len(sys.argv) % 2 == 0
+        options = {"--jobs": "1", "--cache": None, "--cache-size": "512", "--ir-cache": None}
+        for i in range(4, len(sys.argv), 2):
+            assert sys.argv[i] in options
+            options[sys.argv[i]] = sys.argv[i + 1]
+        cache = None
+        if options["--cache"] != None:
+            cache = RenderCache(options["--cache"], int(float(options["--cache-size"]) * 1024 * 1024))
+        os.makedirs(sys.argv[3], exist_ok = True)
+        results = render_batch(read_manifest(sys.argv[2], sys.argv[3]), int(options["--jobs"]), cache, ir_cachedir = options["--ir-cache"])
+        if any([result[3] is not None for result in results]):
+            sys.exit(1)
+    elif sys.argv[1] == "--to-sidecar":
+        assert len(sys.argv) == 4 or len(sys.argv) == 5
+        min_points = int(sys.argv[4]) if len(sys.argv) == 5 else 1024
+        npoints = convert_to_sidecar(sys.argv[2], sys.argv[3], min_points = min_points)
+        print("moved %d values to %s.f64" % (npoints, sys.argv[3]))
     else:
         # must have 3 parameters
         assert len(sys.argv) == 3
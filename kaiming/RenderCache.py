@@ -0,0 +1,76 @@
+import os
+import shutil
+import hashlib
+import matplotlib
+
+class RenderCache:
+    # On-disk cache of rendered pdfs. An entry is keyed by a hash of every
+    # input that can change the picture: the contents of the spec chain, the
+    # style parameters and the matplotlib version. Entries are evicted least
+    # recently used first once the cache grows over max_bytes.
+    def __init__(self, cachedir, max_bytes = 512 * 1024 * 1024):
+        self.cachedir = cachedir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(self.cachedir, exist_ok = True)
+
+    def key(self, files, sources = (), **style):
+        # files : spec chain (and any data files it pulls in)
+        # sources : source files holding the default styles (Painter.py, ...)
+        # style : keyword arguments given to Painter
+        digest = hashlib.sha256()
+        digest.update(("matplotlib " + matplotlib.__version__ + "\n").encode())
+        for name in sorted(style.keys()):
+            digest.update(("%s=%r\n" % (name, style[name])).encode())
+        for filename in list(sources) + list(files):
+            with open(filename, "rb") as f:
+                content = f.read()
+            digest.update(("%d\n" % len(content)).encode())
+            digest.update(content)
+        return digest.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.cachedir, key + ".pdf")
+
+    def fetch(self, key, pdffile):
+        # copy the cached pdf to pdffile; returns False on a miss
+        entry = self.entry(key)
+        if not os.path.isfile(entry):
+            self.misses += 1
+            return False
+        shutil.copyfile(entry, pdffile)
+        # the mtime is what the eviction policy orders by
+        os.utime(entry)
+        self.hits += 1
+        return True
+
+    def store(self, key, pdffile):
+        entry = self.entry(key)
+        tmpfile = entry + ".tmp" + str(os.getpid())
+        shutil.copyfile(pdffile, tmpfile)
+        os.replace(tmpfile, entry)
+        self.stores += 1
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cachedir):
+            if name.endswith(".pdf"):
+                stat = os.stat(os.path.join(self.cachedir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total = sum([entry[1] for entry in entries])
+        for mtime, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cachedir, name))
+            total -= size
+            self.evictions += 1
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups > 0 else 0.0
+        return "cache: %d hits, %d misses (%.1f%% hit rate), %d stored, %d evicted" % (self.hits, self.misses, rate, self.stores, self.evictions)
@@ -0,0 +1,162 @@
+import os
+import numpy as np
+
+# A spec file is a sequence of commands, each followed by its argument lines:
+#
+#   chart          xticks           line           stackbar
+#   LineChart      a<TAB>b<TAB>c    label          2
+#                                   1<TAB>2<TAB>3  label0
+#                                                  1<TAB>2<TAB>3
+#                                                  label1
+#                                                  4<TAB>5<TAB>6
+#
+# The first empty line ends the spec.
+#
+# A numeric row may instead point at a binary sidecar, so that large series
+# are memory-mapped rather than parsed (paths are relative to the spec file):
+#
+#   @series.npy                 whole .npy array (memory-mapped)
+#   @series.npz:name            array "name" of a .npz archive
+#   @series.f64                 raw little-endian float64 block (memory-mapped)
+#   @series.f64:offset:count    count values starting at value number offset
+
+# number of argument lines following each command ("stackbar" is variable)
+command_nargs = {
+    "xticks": 1, "xlabel": 1, "ylabel": 1, "yscale": 1, "title": 1, "ylim": 1,
+    "bar": 2, "barwidth": 1, "stackbar": None,
+    "line": 2, "chart": 1, "legend_ncol": 1, "decimate": 1,
+    "position": 1, "figsize": 1,
+    "ysecondary": 1, "next": 1,
+}
+
+class SpecCommand:
+    def __init__(self, name, args):
+        # name : command name, e.g. "line"
+        self.name = name
+        # args : tuple of typed arguments, e.g. ("label", array([1., 2., 3.]))
+        self.args = args
+
+def read_lines(filename):
+    # one buffered read of the whole file; strip() replaces the old
+    # character-at-a-time clean_head_tail_line loop
+    with open(filename, "r") as f:
+        text = f.read()
+    return [line.lstrip("\t ").rstrip("\t ") for line in text.split("\n")]
+
+def numbered_commands(filename):
+    # yields (line number of the command, command, argument lines) without
+    # converting any values
+    lines = read_lines(filename)
+    # the spec ends at the first empty line; arguments never run past it
+    end = lines.index("") if "" in lines else len(lines)
+    i = 0
+    while i < end:
+        command = lines[i]
+        if not command in command_nargs:
+            raise ValueError("%s:%d: unknown command \"%s\"" % (filename, i + 1, command))
+        nargs = command_nargs[command]
+        if nargs == None:
+            if i + 1 >= end or not lines[i + 1].isdigit():
+                raise ValueError("%s:%d: \"%s\" expects the number of bars on the next line" % (filename, i + 1, command))
+            nargs = 1 + 2 * int(lines[i + 1])
+        args = lines[i + 1:min(i + 1 + nargs, end)]
+        if len(args) != nargs:
+            raise ValueError("%s:%d: \"%s\" expects %d argument lines" % (filename, i + 1, command, nargs))
+        yield i + 1, command, args
+        i += 1 + nargs
+
+def raw_commands(filename):
+    # yields (command, argument lines) without converting any values
+    for line, command, args in numbered_commands(filename):
+        yield command, args
+
+def parse_numbers(row, delimiter):
+    # the whole row is converted in C instead of one float() per field
+    try:
+        values = np.fromstring(row, dtype = np.float64, sep = delimiter)
+        if len(values) == row.count(delimiter) + 1:
+            return values
+    except ValueError:
+        pass
+    # malformed row: let float() point at the offending field
+    return np.array([float(x) for x in row.split(delimiter)])
+
+def sidecar_path(row, filename):
+    # the sidecar file a numeric row of filename points at, or None
+    if not row.startswith("@"):
+        return None
+    return os.path.join(os.path.dirname(filename), row[1:].split(":")[0])
+
+def load_sidecar(row, filename):
+    path = sidecar_path(row, filename)
+    fields = row[1:].split(":")
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode = "r")
+    elif path.endswith(".npz"):
+        with np.load(path) as archive:
+            return archive[fields[1]]
+    elif len(fields) == 3:
+        return np.memmap(path, dtype = "<f8", mode = "r", offset = 8 * int(fields[1]), shape = (int(fields[2]),))
+    return np.memmap(path, dtype = "<f8", mode = "r")
+
+def parse_row(row, delimiter, filename, line):
+    # line : number of the row's line in filename, for errors
+    try:
+        if row.startswith("@"):
+            return load_sidecar(row, filename)
+        return parse_numbers(row, delimiter)
+    except ValueError as e:
+        raise ValueError("%s:%d: %s" % (filename, line, e))
+
+def convert_to_sidecar(inputfile, outputfile, delimiter = "\t", min_points = 1024):
+    # rewrite inputfile as outputfile, moving every numeric row with at least
+    # min_points values into one raw float64 block, outputfile + ".f64"
+    blockfile = outputfile + ".f64"
+    blockname = os.path.basename(blockfile)
+    offset = 0
+    with open(outputfile, "w") as spec, open(blockfile, "wb") as block:
+        for command, args in raw_commands(inputfile):
+            if command == "line" or command == "bar":
+                rows = [1]
+            elif command == "stackbar":
+                rows = range(2, len(args), 2)
+            else:
+                rows = []
+            args = list(args)
+            for i in rows:
+                if args[i].startswith("@"):
+                    continue
+                values = parse_numbers(args[i], delimiter)
+                if len(values) < min_points:
+                    continue
+                block.write(values.astype("<f8").tobytes())
+                args[i] = "@%s:%d:%d" % (blockname, offset, len(values))
+                offset += len(values)
+            spec.write(command + "\n")
+            for arg in args:
+                spec.write(arg + "\n")
+    return offset
+
+def tokenize(filename, delimiter = "\t"):
+    # yields a SpecCommand with typed arguments for every command in filename
+    for line, command, args in numbered_commands(filename):
+        # argument j is on line line + 1 + j
+        if command == "xticks":
+            values = (args[0].split(delimiter),)
+        elif command == "ylim" or command == "position":
+            values = ([int(v) for v in args[0].split(delimiter)],)
+        elif command == "figsize":
+            values = (tuple([float(v) for v in args[0].split(delimiter)]),)
+        elif command == "legend_ncol" or command == "decimate":
+            values = (int(args[0]),)
+        elif command == "barwidth":
+            values = (float(args[0]),)
+        elif command == "line":
+            values = (args[0], parse_row(args[1], delimiter, filename, line + 2))
+        elif command == "bar":
+            values = ([args[0]], [parse_row(args[1], delimiter, filename, line + 2)])
+        elif command == "stackbar":
+            values = (args[1::2], [parse_row(args[j], delimiter, filename, line + 1 + j) for j in range(2, len(args), 2)])
+        else:
+            values = (args[0],)
+        yield SpecCommand(command, values)
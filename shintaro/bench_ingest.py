@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import random
+import tempfile
+from dataframe import *
+from example_plot_kifmm import kifmm_log
+
+# Compares ingesting a synthetic kifmm log with the per-line str.split parser
+# example_plot_kifmm.py used to have against LogIngest's compiled regex.
+#
+#   python bench_ingest.py [--size MB] [--jobs N] [--log PATH]
+#
+# --size : size of the synthetic log (default 1024 MB)
+# --jobs : also time LogIngest with N processes
+# --log  : reuse (or keep) the log at PATH instead of a temporary file
+
+def write_log(path, size):
+    # kifmm-like log of about size bytes: configurations, runs and timings
+    # interleaved with lines no rule matches
+    rng = random.Random(0)
+    labels = ["bolt:FJX:WPR:KH=2:CSAL:AFM=2050:", "icc:WPP:KH=2:", "icc:WPP:CT:KH=2:", "icc:WPP:CL:KH=2:", "icc:WPP:CS:KH=2:", "icc:WPP:DY:KH=2:"]
+    written = 0
+    with open(path, "w") as f:
+        while written < size:
+            for label in labels:
+                for nthreads in [1, 2, 4, 8, 16]:
+                    lines = ["### " + label + " kifmm - MKL_NUM_THREADS=" + str(nthreads) + " OMP_NUM_THREADS=16\n"]
+                    for NP in [12, 14, 16]:
+                        for npts in [100000, 200000, 500000]:
+                            lines.append("NP=" + str(NP) + " PLUMMER_ALPHA=100 ./fmmd--omp_sse_block " + str(npts) + " -N 4000 -omp " + str(NP) + "\n")
+                            for i in range(0, 22):
+                                lines.append("Iteration " + str(i) + " : tree built, " + str(rng.randint(1000, 9999)) + " boxes\n")
+                                lines.append("  Down  : %.6f secs\n" % rng.uniform(0.1, 2.0))
+                                lines.append("  Up    : %.6f secs\n" % rng.uniform(0.1, 2.0))
+                                lines.append("  Memory: %d MB\n" % rng.randint(100, 900))
+                                lines.append("==> Total Execution Time: %.6fD+00 secs\n" % rng.uniform(1.0, 5.0))
+                    block = "".join(lines)
+                    f.write(block)
+                    written += len(block)
+
+def legacy_ingest(path):
+    # the parser example_plot_kifmm.py had before LogIngest
+    g_nskip = 0
+    g_nrepeats = 20
+    label = None
+    df = dataframe()
+    alpha = 0
+    npts_per_box = 0
+    NP = 0
+    npts = 0
+    ndowns, nups, ntotals = (0, 0, 0)
+    for line in open(path):
+        if line.startswith("### ") and " - MKL_NUM_THREADS=" in line:
+            mode = line.split(" ")[1].strip()
+            if "DY:" in mode:
+                mkl_num_threads = 1
+            else:
+                mkl_num_threads = int(line.split("MKL_NUM_THREADS=")[1].split(" ")[0].strip())
+            label = mode
+        elif " ./fmmd--omp_sse_block " in line:
+            npts = int(line.split("./fmmd--omp_sse_block ")[1].split(" ")[0])
+            npts_per_box = int(line.split("./fmmd--omp_sse_block ")[1].split(" ")[2])
+            NP = int(line.split("NP=")[1].split(" ")[0])
+            alpha = int(line.split("PLUMMER_ALPHA=")[1].split(" ")[0])
+            ndowns, nups, ntotals = (0, 0, 0)
+        elif label is not None:
+            dtype = "alpha" + str(alpha) + "_nptsbox" + str(npts_per_box) + "_NP" + str(NP) + "_npts" + str(npts)
+            key = str(mkl_num_threads)
+            if line.startswith("  Down  :"):
+                ndowns += 1
+                if ndowns <= g_nskip or ndowns > g_nskip + g_nrepeats:
+                    continue
+                value = float("0" + line.split("Down  :")[1].strip().split("secs")[0])
+                df.add(dtype + "_down", label, key, value)
+            elif line.startswith("  Up    :"):
+                nups += 1
+                if nups <= g_nskip or nups > g_nskip + g_nrepeats:
+                    continue
+                value = float("0" + line.split("Up    :")[1].strip().split("secs")[0])
+                df.add(dtype + "_up", label, key, value)
+            if "==> Total Execution Time:" in line:
+                ntotals += 1
+                if ntotals <= g_nskip or ntotals > g_nskip + g_nrepeats:
+                    continue
+                value = float("0" + line.split("==> Total Execution Time:")[1].strip().split(" secs")[0].split("D")[0])
+                df.add(dtype + "_total", label, key, value)
+    return df
+
+def count_lines(path):
+    num_lines = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(64 * 1024 * 1024)
+            if not block:
+                break
+            num_lines += block.count(b"\n")
+    return num_lines
+
+def same_samples(df0, df1):
+    if sorted(df0.alldtypes) != sorted(df1.alldtypes):
+        return False
+    for dtype in df0.alldtypes:
+        for vtype in ["cnt", "ave"]:
+            values0, labels0, keys0 = df0.extract(vtype, dtype)
+            values1, labels1, keys1 = df1.extract(vtype, dtype)
+            if labels0 != labels1 or keys0 != keys1 or values0 != values1:
+                return False
+    return True
+
+if __name__ == "__main__":
+    size = 1024
+    jobs = 1
+    logfile = None
+    args = sys.argv[1:]
+    while len(args) > 0:
+        if args[0] == "--size" and len(args) >= 2:
+            size = float(args[1])
+        elif args[0] == "--jobs" and len(args) >= 2:
+            jobs = int(args[1])
+        elif args[0] == "--log" and len(args) >= 2:
+            logfile = args[1]
+        else:
+            print ("Usage: bench_ingest.py [--size MB] [--jobs N] [--log PATH]")
+            exit(-1)
+        args = args[2:]
+
+    if logfile is None:
+        handle, path = tempfile.mkstemp(suffix = ".log")
+        os.close(handle)
+    else:
+        path = logfile
+    try:
+        if logfile is None or not os.path.isfile(path):
+            start = time.time()
+            write_log(path, int(size * 1024 * 1024))
+            sys.stdout.write("wrote %s (%.0f MB) in %.1f s\n" % (path, os.path.getsize(path) / 1048576.0, time.time() - start))
+        num_lines = count_lines(path)
+
+        results = []
+        runs = [("str.split per line", lambda: legacy_ingest(path)), ("LogIngest", lambda: kifmm_log.ingest(path))]
+        if jobs > 1:
+            runs.append(("LogIngest, %d jobs" % jobs, lambda: kifmm_log.ingest(path, jobs = jobs)))
+        for name, run in runs:
+            start = time.time()
+            df = run()
+            seconds = time.time() - start
+            if len(results) == 0:
+                legacy_seconds = seconds
+            results.append(df)
+            sys.stdout.write("%-24s %8.2f s %12.0f lines/s %8.1f MB/s %6.1fx\n" % (name, seconds, num_lines / seconds, os.path.getsize(path) / 1048576.0 / seconds, legacy_seconds / seconds))
+            if len(results) > 1 and not same_samples(results[0], df):
+                sys.stdout.write("  MISMATCH: %s did not produce the same samples\n" % name)
+    finally:
+        if logfile is None:
+            os.remove(path)
@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.image as mpimg
+import numpy as np
+import plot
+
+# Compares rendering many charts of one layout, each on a new figure, with
+# rendering them on the pooled FigureTemplate of that layout.
+#
+#   python bench_plot.py [--charts N] [--kind linechart|barchart|categorybarchart] [--pdf]
+#
+# --charts : number of charts (default 60)
+# --kind   : plot function to time (default linechart)
+# --pdf    : save the charts as pages of one PdfReport instead of png files
+
+def make_charts(kind, num_charts):
+    # num_charts chart data of the same layout and different values, like
+    # the configurations of example_plot_kifmm.py
+    rng = random.Random(0)
+    labels = ["BOLT (opt)", "IOMP (nobind)", "IOMP (true)", "IOMP (close)", "IOMP (spread)"]
+    yaxis_format = plot.AxisFormat("Relative performance", 0, 4.5, "linear", 1.0)
+    charts = []
+    for i in range(0, num_charts):
+        points = plot.PointTable()
+        if kind == "linechart":
+            for label in labels:
+                nths = [1, 2, 4, 8, 16, 32, 64]
+                points.extend(label, nths, [rng.uniform(0.5, 4.0) for nth in nths], [rng.uniform(0.0, 0.2) for nth in nths])
+            xaxis_format = plot.AxisFormat("# of MKL threads", 1, 100, "log", 10)
+            chart = plot.LineChartData(points, {}, xaxis_format, yaxis_format, (5.7, 3.0))
+            chart.legend_ncolumns = 2
+        elif kind == "barchart":
+            for label in labels:
+                points.append(label, None, rng.uniform(0.5, 4.0), rng.uniform(0.0, 0.2))
+            chart = plot.BarChartData(points, None, yaxis_format, (5.7, 3.0))
+        else:
+            for category in ["NP=12", "NP=14", "NP=16"]:
+                for label in labels:
+                    points.append(label, None, rng.uniform(0.5, 4.0), rng.uniform(0.0, 0.2), category)
+            chart = plot.CategoryBarChartData(points, None, yaxis_format, (12.0, 4.0))
+        charts.append(chart)
+    return charts
+
+def render(kind, charts, outdir, pdf):
+    # seconds to render charts into outdir; [png path, ... ] of each chart
+    plot_function = getattr(plot, "plot_" + kind)
+    paths = [os.path.join(outdir, "chart%d.png" % i) for i in range(0, len(charts))]
+    start = time.time()
+    if pdf:
+        with plot.PdfReport(os.path.join(outdir, "charts.pdf")) as report:
+            for chart in charts:
+                plot_function(chart, report)
+    else:
+        for i in range(0, len(charts)):
+            plot_function(charts[i], paths[i])
+    return time.time() - start, paths
+
+def same_images(paths0, paths1):
+    for path0, path1 in zip(paths0, paths1):
+        image0 = mpimg.imread(path0)
+        image1 = mpimg.imread(path1)
+        if image0.shape != image1.shape or not np.array_equal(image0, image1):
+            return False
+    return True
+
+if __name__ == "__main__":
+    num_charts = 60
+    kind = "linechart"
+    pdf = False
+    args = sys.argv[1:]
+    while len(args) > 0:
+        if args[0] == "--charts" and len(args) >= 2:
+            num_charts = int(args[1])
+            args = args[2:]
+        elif args[0] == "--kind" and len(args) >= 2 and args[1] in ["linechart", "barchart", "categorybarchart"]:
+            kind = args[1]
+            args = args[2:]
+        elif args[0] == "--pdf":
+            pdf = True
+            args = args[1:]
+        else:
+            print ("Usage: bench_plot.py [--charts N] [--kind linechart|barchart|categorybarchart] [--pdf]")
+            exit(-1)
+
+    charts = make_charts(kind, num_charts)
+    # the first chart loads the fonts and backends for both runs
+    warmup = tempfile.mkdtemp()
+    outdirs = []
+    try:
+        plot.figure_pool = plot.FigurePool(0)
+        render(kind, charts[:1], warmup, False)
+        results = []
+        for name, max_templates in [("new figure per chart", 0), ("pooled templates", 8)]:
+            plot.figure_pool = plot.FigurePool(max_templates)
+            outdirs.append(tempfile.mkdtemp())
+            seconds, paths = render(kind, charts, outdirs[-1], pdf)
+            if len(results) == 0:
+                base_seconds = seconds
+            results.append(paths)
+            sys.stdout.write("%-24s %8.2f s %8.1f ms/chart %6.2fx\n" % (name, seconds, seconds * 1000.0 / num_charts, base_seconds / seconds))
+            plot.figure_pool.close()
+        if not pdf and not same_images(results[0], results[1]):
+            sys.stdout.write("  MISMATCH: pooled templates did not render the same images\n")
+    finally:
+        for outdir in [warmup] + outdirs:
+            shutil.rmtree(outdir)
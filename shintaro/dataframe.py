@@ -1,6 +1,10 @@
 
+import os
 import re
 import sys
+import json
+import random
+from array import array
 import numpy as np
 import scipy.stats as st
 
@@ -16,8 +20,122 @@ import scipy.stats as st
 #
 # dtype[0]
 # ...
+#
+# dtype, label and key names are interned to integer codes by an OrderedIndex
+# each (their index in alldtypes, alllabels and allkeys, i.e. in first-seen
+# order) and every cell is a growable array('d'):
+#
+#   cells[dtype code][label code][key code] = array('d', [value, ...])
+#
+# A dataframe(mode = "streaming") keeps a StreamingCell per cell instead,
+# which holds running moments and a bounded sample rather than every value.
+#
+# save() writes a snapshot, load() maps it back; see dataframe.save.
+#
+# to_pandas() / to_arrow() export the samples as a long table, one row per
+# sample, and from_pandas() / from_arrow() import such a table:
+#
+#   dtype     label     key     sample_idx  value
+#   dtype[0]  label[0]  key[0]  0           value[0-0][0]
+#   dtype[0]  label[0]  key[0]  1           value[0-0][1]
+#   ...
+#
+# dtype, label and key are categorical (dictionary) columns over the names in
+# first-seen order, their codes being the dataframe's own.
 ################################################################################
 
+class OrderedIndex:
+    # insertion ordered set of names with O(1) lookup of a name's code
+    def __init__(self):
+        self.names = []
+        self.codes = {}
+
+    def code(self, name):
+        # code of name, appending it if it is new
+        code = self.codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self.codes[name] = code
+            self.names.append(name)
+        return code
+
+    def __contains__(self, name):
+        return name in self.codes
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+class StreamingCell:
+    # running count, mean and sum of squared deviations (Welford) of a cell,
+    # plus a uniform reservoir sample of at most reservoir_size values that
+    # stands in for the samples when the median is asked for
+    def __init__(self, reservoir_size, random):
+        self.reservoir_size = reservoir_size
+        self.random = random
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.squares = 0.0
+        self.reservoir = array('d')
+
+    def __len__(self):
+        return self.count
+
+    def sample(self, value):
+        # reservoir sampling (algorithm R); self.count already includes value
+        if len(self.reservoir) < self.reservoir_size:
+            self.reservoir.append(value)
+        elif self.reservoir_size > 0:
+            i = self.random.randrange(self.count)
+            if i < self.reservoir_size:
+                self.reservoir[i] = value
+
+    def append(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.squares += delta * (value - self.mean)
+        self.sample(value)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype = np.float64)
+        if len(values) == 0:
+            return
+        # combine the moments of the batch with the running ones (Chan et al.)
+        mean = float(np.mean(values))
+        squares = float(np.dot(values - mean, values - mean))
+        count = self.count + len(values)
+        delta = mean - self.mean
+        self.mean += delta * len(values) / count
+        self.squares += squares + delta * delta * self.count * len(values) / count
+        for value in values.tolist():
+            self.count += 1
+            self.sample(value)
+
+    def merge(self, other):
+        # adds the samples summarised by another StreamingCell: the moments
+        # are combined exactly, the reservoirs in proportion to the counts
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.squares += other.squares + delta * delta * self.count * other.count / count
+        if len(self.reservoir) + len(other.reservoir) <= self.reservoir_size:
+            self.reservoir.extend(other.reservoir)
+        else:
+            mine = int(round(self.reservoir_size * float(self.count) / count))
+            mine = max(self.reservoir_size - len(other.reservoir), min(mine, len(self.reservoir)))
+            samples = self.random.sample(list(self.reservoir), mine) + self.random.sample(list(other.reservoir), self.reservoir_size - mine)
+            self.reservoir = array('d', samples)
+        self.count = count
+
 class dataframe:
     @staticmethod
     def atoi(text):
@@ -33,122 +151,583 @@ class dataframe:
         '''
         return [ dataframe.atoi(c) for c in re.split('(\d+)', text) ]
 
-    def __init__(self):
-        self.data = {}
-        self.alldtypes = []
-        self.alllabels = []
-        self.allkeys = []
+    def __init__(self, mode = "exact", reservoir_size = 256, seed = 0):
+        # mode : "exact" keeps every sample, "streaming" only the moments and
+        #        a sample of reservoir_size values per cell (used for "med")
+        assert (mode == "exact" or mode == "streaming"), 'mode must be "exact" or "streaming".'
+        self.mode = mode
+        self.reservoir_size = reservoir_size
+        self.random = random.Random(seed)
+        self.cells = {}
+        self.dtypes = OrderedIndex()
+        self.labels = OrderedIndex()
+        self.keys = OrderedIndex()
+        # first-seen order of every dimension
+        self.alldtypes = self.dtypes.names
+        self.alllabels = self.labels.names
+        self.allkeys = self.keys.names
+        # (dtype, label, key) -> cell, so that repeated adds skip the interning
+        self.cell_index = {}
+        # (dtype, label, key) -> {vtype: value}, see cell_stats
+        self.stats = {}
+        self.stats_hits = 0
+        self.stats_misses = 0
+        # dtype code -> pack, see pack()
+        self.packs = {}
+        # (dtype, label, key) -> read-only numpy cell of a loaded snapshot, in
+        # cells too but not in cell_index until it is written to
+        self.mapped = {}
 
     def init_array(self, dtype, label, key):
-        if not dtype in self.data:
-            self.data[dtype] = {}
-            self.alldtypes.append(dtype)
-        if not label in self.data[dtype]:
-            self.data[dtype][label] = {}
-            if not label in self.alllabels:
-                self.alllabels.append(label)
-        if not key in self.data[dtype][label]:
-            self.data[dtype][label][key] = []
-            if not key in self.allkeys:
-                self.allkeys.append(key)
+        # returns the cell of (dtype, label, key) for writing, creating it
+        # (or copying it out of a loaded snapshot) if needed
+        cell = self.cell_index.get((dtype, label, key))
+        if cell is not None:
+            return cell
+        d = self.dtypes.code(dtype)
+        l = self.labels.code(label)
+        k = self.keys.code(key)
+        labels = self.cells.get(d)
+        if labels is None:
+            labels = self.cells[d] = {}
+        keys = labels.get(l)
+        if keys is None:
+            keys = labels[l] = {}
+        cell = keys.get(k)
+        if cell is None:
+            if self.mode == "streaming":
+                cell = keys[k] = StreamingCell(self.reservoir_size, self.random)
+            else:
+                cell = keys[k] = array('d')
+        elif isinstance(cell, np.ndarray):
+            values = cell
+            cell = keys[k] = array('d')
+            cell.frombytes(values.tobytes())
+            del self.mapped[(dtype, label, key)]
+            self.packs.pop(d, None)
+        self.cell_index[(dtype, label, key)] = cell
+        return cell
+
+    def find_cell(self, dtype, label, key):
+        # returns the cell of (dtype, label, key) for reading
+        cell = self.mapped.get((dtype, label, key))
+        if cell is None:
+            cell = self.init_array(dtype, label, key)
+        return cell
 
     def add(self, dtype, label, key, value):
-        self.init_array(dtype, label, key)
-        self.data[dtype][label][key].append(value)
+        self.init_array(dtype, label, key).append(value)
+
+    def add_many(self, dtype, label, key, values):
+        # values : sequence or numpy array of samples of one cell
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        self.init_array(dtype, label, key).extend(values)
+
+    def overwrite(self, dtype, label, key, value):
+        cell = self.init_array(dtype, label, key)
+        self.stats.pop((dtype, label, key), None)
+        self.packs.pop(self.dtypes.codes[dtype], None)
+        if self.mode == "streaming":
+            cell.reset()
+        else:
+            del cell[:]
+        cell.append(value)
 
-    def overwrite(self, dtype, label, key):
-        self.init_array(dtype, label, key)
-        self.data[dtype][label][key] = [value]
+    def merge(self, other):
+        # appends every cell of other to this dataframe (returned), keeping
+        # other's first-seen order for names new to this one. Samples are
+        # concatenated; streaming cells are combined, an exact dataframe can
+        # take in a streaming one only in streaming mode.
+        if self.mode == "exact" and other.mode == "streaming":
+            raise ValueError("an exact dataframe cannot merge a streaming one")
+        for name in other.alldtypes:
+            self.dtypes.code(name)
+        for name in other.alllabels:
+            self.labels.code(name)
+        for name in other.allkeys:
+            self.keys.code(name)
+        for d in other.cells:
+            for l in other.cells[d]:
+                for k, cell in other.cells[d][l].items():
+                    mine = self.init_array(other.alldtypes[d], other.alllabels[l], other.allkeys[k])
+                    if other.mode == "streaming":
+                        mine.merge(cell)
+                    elif isinstance(cell, np.ndarray):
+                        mine.extend(cell.tolist())
+                    else:
+                        mine.extend(cell)
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    @staticmethod
+    def tree_reduce(partials, pool = None):
+        # merges partials (in order) pairwise in log2(len(partials)) rounds,
+        # each round's merges running in pool (a multiprocessing.Pool) if given.
+        # Without a pool the left partial of each pair is merged into, so the
+        # result is partials[0] and the partials are modified; a pool works
+        # on pickled copies. Serially, folding the partials into one
+        # dataframe with merge() copies fewer samples
+        partials = list(partials)
+        if len(partials) == 0:
+            return dataframe()
+        while len(partials) > 1:
+            pairs = [(partials[i], partials[i + 1]) for i in range(0, len(partials) - 1, 2)]
+            merged = pool.map(merge_pair, pairs) if pool is not None else [merge_pair(pair) for pair in pairs]
+            if len(partials) % 2 == 1:
+                merged.append(partials[-1])
+            partials = merged
+        return partials[0]
 
     def get_raw(self, dtype, label, key):
-        self.init_array(dtype, label, key)
-        return self.data[dtype][label][key]
+        # a copy, so that the cell stays appendable; in streaming mode only
+        # the reservoir sample is left
+        cell = self.find_cell(dtype, label, key)
+        if self.mode == "streaming":
+            return np.array(cell.reservoir, dtype = np.float64)
+        return np.array(cell, dtype = np.float64)
+
+    def dtype_labels(self, dtype):
+        # labels that have cells in dtype, in insertion order
+        return [self.alllabels[l] for l in self.cells[self.dtypes.codes[dtype]]]
+
+    def cell_stats(self, dtype, label, key):
+        # cached aggregates of one cell: the moments are computed in one pass
+        # on a miss, "med", "s95" and "s99" are added by get() when asked for.
+        # An entry is stale once the cell's length no longer matches its
+        # "cnt", i.e. after any add or add_many; overwrite drops it.
+        cell = self.find_cell(dtype, label, key)
+        stats = self.stats.get((dtype, label, key))
+        if stats is not None and stats["cnt"] == len(cell):
+            self.stats_hits += 1
+            return stats
+        self.stats_misses += 1
+        if self.mode == "streaming":
+            len_values = cell.count
+            mean = cell.mean
+            squares = cell.squares
+        else:
+            values = np.array(cell, dtype = np.float64)
+            len_values = len(values)
+            mean = np.mean(values) if len_values > 0 else 0.0
+            squares = np.dot(values - mean, values - mean)
+        stats = {"cnt": len_values}
+        if len_values > 0:
+            for vtype in ["ave", "bsd", "usd"]:
+                stats[vtype] = dataframe.finish(vtype, len_values, mean, squares)
+        self.stats[(dtype, label, key)] = stats
+        return stats
 
     def get(self, dtype, label, key, vtype):
-        values = self.get_raw(dtype, label, key)
-        len_values = len(values)
+        stats = self.cell_stats(dtype, label, key)
+        len_values = stats["cnt"]
         if len_values == 0:
             return 0.0
-        if vtype == "ave":
-            return np.mean(values)
-        elif vtype == "med":
-            return np.median(values)
-        elif vtype == "bsd":
-            return np.std(values, ddof = 0)
-        elif vtype == "usd":
-            # not strictly unbiased: https://en.wikipedia.org/wiki/Unbiased_estimation_of_standard_deviation
-            return np.std(values, ddof = 1)
+        if vtype in stats:
+            return stats[vtype]
+        if vtype == "med":
+            value = dataframe.median(self.get_raw(dtype, label, key))
         elif vtype == "s95":
-            interval = st.t.interval(0.95, len(values) - 1, loc = np.mean(values), scale = st.sem(values))
-            return interval[1] - np.mean(values)
+            value = dataframe.half_width(0.95, len_values, stats["usd"])
         elif vtype == "s99":
-            interval = st.t.interval(0.99, len(values) - 1, loc = np.mean(values), scale = st.sem(values))
-            return interval[1] - np.mean(values)
-        elif vtype == "cnt":
-            return len_values
-        return 0
+            value = dataframe.half_width(0.99, len_values, stats["usd"])
+        else:
+            return 0
+        stats[vtype] = value
+        return value
+
+    def cache_info(self):
+        # (hits, misses, cached cells) of the cell_stats cache
+        return self.stats_hits, self.stats_misses, len(self.stats)
 
     def has_dtype(self, dtype):
-        return dtype in self.data
+        return dtype in self.dtypes
+
+    def sorted_labels_keys(self, dtype, labels = None, keys = None):
+        # labels and keys of dtype in natural order, unless given
+        if labels is None:
+            labels = sorted(self.dtype_labels(dtype), key = dataframe.natural_keys) if dtype in self.dtypes else []
+        if keys is None:
+            key_codes = set()
+            if dtype in self.dtypes:
+                cells_by_label = self.cells[self.dtypes.codes[dtype]]
+                for label in labels:
+                    key_codes.update(cells_by_label.get(self.labels.codes.get(label), ()))
+            keys = sorted([self.allkeys[k] for k in sorted(key_codes)], key = dataframe.natural_keys)
+        return labels, keys
 
     def print_data(self, vtype, dtypes = None, labels = None, keys = None):
         if dtypes is None:
             dtypes = sorted(self.alldtypes, key = dataframe.natural_keys)
         for dtype in dtypes:
             sys.stdout.write("## dtype = " + dtype + " : " + vtype + "\n")
-            if labels is None:
-                print_labels = sorted(self.data[dtype].keys(), key = dataframe.natural_keys)
-            else:
-                print_labels = labels
+            retvals, print_labels, print_keys = self.extract(vtype, dtype, labels, keys)
             for label in print_labels:
                 sys.stdout.write("\t" + label)
             sys.stdout.write("\n")
 
-            if keys is None:
-                local_allkeys = []
-                for label in print_labels:
-                    if not label in self.data[dtype].keys():
-                        continue
-                    for key in self.data[dtype][label].keys():
-                        if not key in local_allkeys:
-                            local_allkeys.append(key)
-                print_keys = sorted(local_allkeys, key = dataframe.natural_keys)
-            else:
-                print_keys = keys
-
-            for key in print_keys:
-                sys.stdout.write(str(key))
-                for label in print_labels:
-                    sys.stdout.write("\t" + str(self.get(dtype, label, key, vtype)))
+            for j in range(0, len(print_keys)):
+                sys.stdout.write(str(print_keys[j]))
+                for i in range(0, len(print_labels)):
+                    sys.stdout.write("\t" + str(retvals[i][j]))
                 sys.stdout.write("\n")
             sys.stdout.write("\n")
 
+    @staticmethod
+    def half_width(level, counts, usd):
+        # upper half width of the t confidence interval of the mean
+        return st.t.ppf(0.5 + level / 2.0, counts - 1) * usd / np.sqrt(counts)
+
+    @staticmethod
+    def median(values):
+        # np.median, but nan rather than a warning for no samples
+        return np.median(values) if len(values) > 0 else np.nan
+
+    @staticmethod
+    def finish(vtype, counts, means, squares):
+        # vtype from the count, mean and sum of squared deviations; works on
+        # scalars (one cell) and arrays (many cells) alike
+        if vtype == "cnt":
+            return counts
+        elif vtype == "ave":
+            return means
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            if vtype == "bsd":
+                return np.sqrt(np.divide(squares, counts))
+            # not strictly unbiased: https://en.wikipedia.org/wiki/Unbiased_estimation_of_standard_deviation
+            usd = np.sqrt(np.divide(squares, counts - 1))
+            if vtype == "usd":
+                return usd
+            elif vtype == "s95":
+                return dataframe.half_width(0.95, counts, usd)
+            elif vtype == "s99":
+                return dataframe.half_width(0.99, counts, usd)
+        return np.zeros(np.shape(counts))
+
+    @staticmethod
+    def aggregate(vtype, values, counts):
+        # vtype of every segment of values, the segments being consecutive
+        # runs of counts[i] (> 0) samples
+        if vtype == "cnt":
+            return counts
+        starts = np.cumsum(counts) - counts
+        if vtype == "med":
+            # segments of equal length are stacked into one matrix each
+            medians = np.empty(len(counts))
+            for count in np.unique(counts):
+                selected = np.flatnonzero(counts == count)
+                medians[selected] = np.median(values[starts[selected, None] + np.arange(count)], axis = 1)
+            return medians
+        means = np.add.reduceat(values, starts) / counts
+        deviations = values - np.repeat(means, counts)
+        squares = np.add.reduceat(deviations * deviations, starts)
+        return dataframe.finish(vtype, counts, means, squares)
+
+    def pack(self, dtype):
+        # all non-empty cells of dtype gathered into one flat array, with the
+        # label code, key code and sample count of each segment (in streaming
+        # mode their moments instead of the flat array). The pack is
+        # reused while no cell of dtype is created or grows; overwrite drops
+        # it. Aggregates computed over it are kept in its "stats".
+        d = self.dtypes.codes[dtype]
+        cells_by_label = self.cells[d]
+        num_cells = sum([len(cells_by_key) for cells_by_key in cells_by_label.values()])
+        pack = self.packs.get(d)
+        if pack is not None and pack["num_cells"] == num_cells and sum(map(len, pack["cells"])) == pack["num_values"]:
+            return pack
+        label_codes = []
+        key_codes = []
+        cells = []
+        values = array('d')
+        for l in cells_by_label:
+            for k, cell in cells_by_label[l].items():
+                cells.append(cell)
+                if len(cell) > 0:
+                    label_codes.append(l)
+                    key_codes.append(k)
+                    if isinstance(cell, np.ndarray):
+                        values.frombytes(cell.tobytes())
+                    elif self.mode == "exact":
+                        values.extend(cell)
+        pack = {
+            "num_cells": num_cells,
+            "num_values": sum(map(len, cells)),
+            "cells": cells,
+            "labels": np.array(label_codes, dtype = np.int64),
+            "keys": np.array(key_codes, dtype = np.int64),
+            "counts": np.array([len(cell) for cell in cells if len(cell) > 0], dtype = np.int64),
+            "values": np.frombuffer(values, dtype = np.float64),
+            "stats": {},
+        }
+        if self.mode == "streaming":
+            pack["values"] = None
+            pack["means"] = np.array([cell.mean for cell in cells if cell])
+            pack["squares"] = np.array([cell.squares for cell in cells if cell])
+        self.packs[d] = pack
+        return pack
+
+    def pack_stats(self, pack, vtype):
+        # vtype of every segment of pack
+        if not vtype in pack["stats"]:
+            if self.mode == "exact":
+                pack["stats"][vtype] = dataframe.aggregate(vtype, pack["values"], pack["counts"])
+            elif vtype == "med":
+                pack["stats"][vtype] = np.array([dataframe.median(cell.reservoir) for cell in pack["cells"] if cell])
+            else:
+                pack["stats"][vtype] = dataframe.finish(vtype, pack["counts"], pack["means"], pack["squares"])
+        return pack["stats"][vtype]
+
     # dtype
     #              keys[0]     keys[1]     keys[2]    ...
     #  labels[0] [[value[0-0], value[1-0], value[2-0], ...],
     #  labels[1]  [value[0-1], value[1-1], value[2-1], ...],
     #  labels[2]  [value[0-2], value[1-2], value[2-2], ...], ... ]
+
+    def extract_matrix(self, vtype, dtype, labels = None, keys = None):
+        # as extract, but the values come as a len(labels) x len(keys) numpy
+        # matrix, aggregated over all cells of dtype at once (empty cells are 0)
+        labels, keys = self.sorted_labels_keys(dtype, labels, keys)
+        if not dtype in self.dtypes:
+            return np.zeros((len(labels), len(keys))), labels, keys
+        pack = self.pack(dtype)
+        stats = self.pack_stats(pack, vtype)
+        # rows and columns of the requested (unique) labels and keys by code
+        label_index = OrderedIndex()
+        label_positions = [label_index.code(label) for label in labels]
+        key_index = OrderedIndex()
+        key_positions = [key_index.code(key) for key in keys]
+        rows = np.full(len(self.alllabels), -1)
+        for label in label_index:
+            if label in self.labels:
+                rows[self.labels.codes[label]] = label_index.codes[label]
+        columns = np.full(len(self.allkeys), -1)
+        for key in key_index:
+            if key in self.keys:
+                columns[self.keys.codes[key]] = key_index.codes[key]
+        rows = rows[pack["labels"]]
+        columns = columns[pack["keys"]]
+        selected = (rows >= 0) & (columns >= 0)
+        matrix = np.zeros((len(label_index), len(key_index)))
+        matrix[rows[selected], columns[selected]] = stats[selected]
+        return matrix[np.ix_(label_positions, key_positions)], labels, keys
+
     def extract(self, vtype, dtype, labels = None, keys = None):
-        retvals = []
-        if not dtype in self.alldtypes:
-            retvals = [[0.0 for i in range(0, len(keys))] for j in range(0, len(labels))]
-            return retvals
+        matrix, labels, keys = self.extract_matrix(vtype, dtype, labels, keys)
+        if vtype == "cnt":
+            matrix = matrix.astype(np.int64)
+        return matrix.tolist(), labels, keys
 
-        if labels is None:
-            labels = sorted(self.data[dtype].keys(), key = dataframe.natural_keys)
-        if keys is None:
-            local_allkeys = []
-            for label in labels:
-                if not label in self.data[dtype].keys():
-                    continue
-                for key in self.data[dtype][label].keys():
-                    if not key in local_allkeys:
-                        local_allkeys.append(key)
-                keys = sorted(local_allkeys, key = dataframe.natural_keys)
-
-        for label in labels:
-            local_retval = []
-            for key in keys:
-                local_retval.append(self.get(dtype, label, key, vtype))
-            retvals.append(local_retval)
-        return retvals, labels, keys
+    def columns(self):
+        # the long table of to_pandas as numpy arrays: {"dtype": codes,
+        # "label": codes, "key": codes, "sample_idx": ..., "value": ...}.
+        # The values of a single dtype are its pack's, without a copy.
+        if self.mode == "streaming":
+            raise ValueError("a streaming dataframe keeps no samples to export")
+        columns = {"dtype": [], "label": [], "key": [], "sample_idx": [], "value": []}
+        for d in self.cells:
+            pack = self.pack(self.alldtypes[d])
+            counts = pack["counts"]
+            starts = np.cumsum(counts) - counts
+            columns["dtype"].append(np.full(len(pack["values"]), d, dtype = np.int64))
+            columns["label"].append(np.repeat(pack["labels"], counts))
+            columns["key"].append(np.repeat(pack["keys"], counts))
+            columns["sample_idx"].append(np.arange(len(pack["values"]), dtype = np.int64) - np.repeat(starts, counts))
+            columns["value"].append(pack["values"])
+        for name in columns:
+            if len(columns[name]) == 0:
+                columns[name] = np.zeros(0, dtype = np.float64 if name == "value" else np.int64)
+            elif len(columns[name]) == 1:
+                columns[name] = columns[name][0]
+            else:
+                columns[name] = np.concatenate(columns[name])
+        return columns
+
+    def to_pandas(self):
+        pd = import_optional("pandas", "dataframe.to_pandas")
+        columns = self.columns()
+        for name, names in [("dtype", self.alldtypes), ("label", self.alllabels), ("key", self.allkeys)]:
+            columns[name] = pd.Categorical.from_codes(columns[name], categories = list(names))
+        return pd.DataFrame(columns, copy = False)
+
+    def to_arrow(self):
+        pa = import_optional("pyarrow", "dataframe.to_arrow")
+        columns = self.columns()
+        for name, names in [("dtype", self.alldtypes), ("label", self.alllabels), ("key", self.allkeys)]:
+            columns[name] = pa.DictionaryArray.from_arrays(columns[name].astype(np.int32), pa.array(names, type = pa.string()))
+        return pa.table(columns)
+
+    @staticmethod
+    def from_columns(names, codes, sample_idx, values, mode = "exact"):
+        # the dataframe of a long table given as
+        #   names : (dtype names, label names, key names)
+        #   codes : (dtype codes, label codes, key codes) of every row
+        # with the rows of a cell in any order (sample_idx orders them). A
+        # code of -1 (pandas' and our null) raises a ValueError
+        df = dataframe(mode)
+        values = np.asarray(values, dtype = np.float64)
+        if len(values) == 0:
+            return df
+        # only names with rows are interned, in the order given
+        renumbered = []
+        for index, name, dimension, dimension_codes in zip([df.dtypes, df.labels, df.keys], ["dtype", "label", "key"], names, codes):
+            dimension_codes = np.asarray(dimension_codes, dtype = np.int64)
+            nulls = np.flatnonzero(dimension_codes < 0)
+            if len(nulls) > 0:
+                raise ValueError("%d rows have no %s (the first is row %d)" % (len(nulls), name, nulls[0]))
+            recode = np.full(len(dimension), -1, dtype = np.int64)
+            for c in np.unique(dimension_codes).tolist():
+                recode[c] = index.code(str(dimension[c]))
+            renumbered.append(recode[dimension_codes])
+        dtype_codes, label_codes, key_codes = renumbered
+        order = np.lexsort((np.asarray(sample_idx), key_codes, label_codes, dtype_codes))
+        dtype_codes = dtype_codes[order]
+        label_codes = label_codes[order]
+        key_codes = key_codes[order]
+        values = values[order]
+        changes = (np.diff(dtype_codes) != 0) | (np.diff(label_codes) != 0) | (np.diff(key_codes) != 0)
+        starts = np.concatenate([[0], np.flatnonzero(changes) + 1])
+        ends = np.concatenate([starts[1:], [len(values)]])
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            df.add_many(df.alldtypes[dtype_codes[start]], df.alllabels[label_codes[start]], df.allkeys[key_codes[start]], values[start:end])
+        return df
+
+    @staticmethod
+    def from_pandas(frame, mode = "exact"):
+        # frame : long table with dtype, label, key, sample_idx and value
+        #         columns, categorical or not
+        pd = import_optional("pandas", "dataframe.from_pandas")
+        names = []
+        codes = []
+        for name in ["dtype", "label", "key"]:
+            column = frame[name]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                names.append(list(column.cat.categories))
+                codes.append(column.cat.codes.to_numpy())
+            else:
+                column_codes, uniques = pd.factorize(column)
+                names.append(list(uniques))
+                codes.append(column_codes)
+        return dataframe.from_columns(names, codes, frame["sample_idx"].to_numpy(), frame["value"].to_numpy(dtype = np.float64), mode)
+
+    @staticmethod
+    def from_arrow(table, mode = "exact"):
+        # table : pyarrow.Table laid out as to_arrow's
+        pa = import_optional("pyarrow", "dataframe.from_arrow")
+        names = []
+        codes = []
+        for name in ["dtype", "label", "key"]:
+            column = table.column(name).combine_chunks()
+            if not pa.types.is_dictionary(column.type):
+                column = column.dictionary_encode()
+            names.append(column.dictionary.to_pylist())
+            # null indices would come out as NaN
+            codes.append(column.indices.fill_null(-1).to_numpy(zero_copy_only = False))
+        return dataframe.from_columns(names, codes, table.column("sample_idx").to_numpy(), table.column("value").to_numpy(), mode)
+
+    # snapshot layout (little endian):
+    #   snapshot_magic
+    #   uint64 header length, json header (dimensions, mode, cell count),
+    #       padded to 8 bytes
+    #   int64 cells x 6 table: dtype code, label code, key code, offset and
+    #       length of the cell's values, number of samples
+    #   float64 cells x 2 table: mean, sum of squared deviations (streaming)
+    #   float64 values of all cells (streaming: the reservoirs)
+    snapshot_magic = b"dataframe v1\x00\x00\x00\x00"
+
+    def save(self, path):
+        cells = []
+        for d in self.cells:
+            for l in self.cells[d]:
+                for k, cell in self.cells[d][l].items():
+                    cells.append((d, l, k, cell))
+        header = json.dumps({
+            "mode": self.mode,
+            "reservoir_size": self.reservoir_size,
+            "dtypes": self.alldtypes,
+            "labels": self.alllabels,
+            "keys": self.allkeys,
+            "num_cells": len(cells),
+        }).encode("utf-8")
+        header += b" " * (-len(header) % 8)
+        table = np.zeros((len(cells), 6), dtype = "<i8")
+        moments = np.zeros((len(cells), 2), dtype = "<f8")
+        offset = 0
+        for i in range(0, len(cells)):
+            d, l, k, cell = cells[i]
+            if self.mode == "streaming":
+                length = len(cell.reservoir)
+                moments[i] = (cell.mean, cell.squares)
+            else:
+                length = len(cell)
+            table[i] = (d, l, k, offset, length, len(cell))
+            offset += length
+        tmpfile = path + ".tmp" + str(os.getpid())
+        with open(tmpfile, "wb") as f:
+            f.write(dataframe.snapshot_magic)
+            f.write(np.array([len(header)], dtype = "<u8").tobytes())
+            f.write(header)
+            f.write(table.tobytes())
+            if self.mode == "streaming":
+                f.write(moments.tobytes())
+            for d, l, k, cell in cells:
+                values = cell.reservoir if self.mode == "streaming" else cell
+                f.write(np.asarray(values, dtype = "<f8").tobytes())
+        os.replace(tmpfile, path)
+
+    @staticmethod
+    def load(path, mmap = True):
+        # mmap : map the values instead of reading them, so that only the
+        #        cells touched are paged in; a cell is copied out of the
+        #        snapshot the first time it is written to
+        with open(path, "rb") as f:
+            magic = f.read(len(dataframe.snapshot_magic))
+            if magic != dataframe.snapshot_magic:
+                raise ValueError("%s: not a dataframe snapshot" % path)
+            header_size = int(np.frombuffer(f.read(8), dtype = "<u8")[0])
+            header = json.loads(f.read(header_size).decode("utf-8"))
+            num_cells = header["num_cells"]
+            table = np.frombuffer(f.read(num_cells * 6 * 8), dtype = "<i8").reshape(num_cells, 6)
+            if header["mode"] == "streaming":
+                moments = np.frombuffer(f.read(num_cells * 2 * 8), dtype = "<f8").reshape(num_cells, 2)
+            values_offset = f.tell()
+        num_values = int(table[:, 4].sum())
+        if mmap and num_values > 0:
+            values = np.memmap(path, dtype = "<f8", mode = "r", offset = values_offset, shape = (num_values,))
+        else:
+            values = np.fromfile(path, dtype = "<f8", offset = values_offset, count = num_values)
+
+        df = dataframe(header["mode"], header["reservoir_size"])
+        for name in header["dtypes"]:
+            df.dtypes.code(name)
+        for name in header["labels"]:
+            df.labels.code(name)
+        for name in header["keys"]:
+            df.keys.code(name)
+        for i in range(0, num_cells):
+            d, l, k, offset, length, count = table[i].tolist()
+            cells_by_key = df.cells.setdefault(d, {}).setdefault(l, {})
+            cell_name = (df.alldtypes[d], df.alllabels[l], df.allkeys[k])
+            if df.mode == "streaming":
+                cell = StreamingCell(df.reservoir_size, df.random)
+                cell.count = count
+                cell.mean, cell.squares = moments[i].tolist()
+                cell.reservoir.frombytes(values[offset:offset + length].tobytes())
+                df.cell_index[cell_name] = cell
+            else:
+                cell = values[offset:offset + length]
+                df.mapped[cell_name] = cell
+            cells_by_key[k] = cell
+        return df
+
+def import_optional(module, user):
+    # pandas and pyarrow are only needed by the bridges that use them
+    try:
+        return __import__(module)
+    except ImportError:
+        raise ImportError("%s needs %s, which is not installed" % (user, module))
+
+def merge_pair(pair):
+    # pool task of dataframe.tree_reduce
+    return pair[0].merge(pair[1])
@@ -0,0 +1,309 @@
+import os
+import re
+import mmap
+import itertools
+import multiprocessing
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+from dataframe import dataframe
+
+################################################################################
+# Declarative log ingestion into a dataframe.
+#
+# A log is read line by line. A HeaderRule whose pattern matches a line sets
+# context values (its named groups plus fixed values), e.g. the run's label or
+# problem size. Otherwise the first matching MetricRule's "value" group
+# becomes a sample whose dtype, label and key are formatted from the context:
+#
+#   HeaderRule(r"^### (?P<label>[^ \n]*)")
+#   MetricRule(r"^  Down  :[ \t]*(?P<value>[0-9.eE+-]*)", "{size}_down", "{label}", "{threads}")
+#
+# A MetricRule only counts once every field of its templates is in the
+# context, and of the samples it counts since the last reset (a HeaderRule
+# with reset = True) it keeps numbers nskip + 1 .. nskip + nrepeats.
+#
+# All rules are compiled into one bytes regex "\n(?:rule 0|rule 1|...)", in
+# rule order (headers first) and each alternative anchored to the start of a
+# line, so a single finditer over a whole buffer yields the first rule
+# matching each line and skips every other line in C. Patterns must therefore
+# match within a single line (RuleSet rejects a pattern with any part that can
+# match "\n", such as \s or [^ ]; use [ \t] and [^ \n]), their group names
+# are private to the rule and neither named nor numbered backreferences are
+# supported. Patterns starting with "^" are the cheapest: they are tried at
+# the start of each line only, so a "^" pattern that has to look through the
+# line is best guarded with a greedy lookahead for a literal it needs, e.g.
+# "^(?=[^\n]* run )...".
+#
+# Large files are cut at reset lines, so that a chunk only depends on the
+# context at its first line: the parent scans the header lines once to find
+# the cuts and that context, and the chunks are parsed in a process pool.
+################################################################################
+
+class HeaderRule:
+    def __init__(self, pattern, fixed = None, types = None, reset = False):
+        # pattern : regex, named groups are stored into the context
+        self.pattern = pattern
+        # fixed : {name: value, ... } also stored on a match
+        self.fixed = fixed if fixed is not None else {}
+        # types : {name: int, ... } conversion of group values (default str)
+        self.types = types if types is not None else {}
+        # reset : a match restarts the nskip/nrepeats window of every metric
+        self.reset = reset
+
+    def apply(self, values, context):
+        # values : {group name: str or None, ... } of a match
+        for name, value in values.items():
+            if value is not None:
+                context[name] = self.types.get(name, str)(value)
+        context.update(self.fixed)
+
+class MetricRule:
+    def __init__(self, pattern, dtype, label, key, nskip = 0, nrepeats = None):
+        # pattern : regex with a "value" group
+        self.pattern = pattern
+        # dtype, label, key : str.format templates over the context
+        self.dtype = dtype
+        self.label = label
+        self.key = key
+        # samples nskip + 1 .. nskip + nrepeats are kept (nrepeats None: all)
+        self.nskip = nskip
+        self.nrepeats = nrepeats
+
+    def in_window(self, count):
+        if count <= self.nskip:
+            return False
+        return self.nrepeats is None or count <= self.nskip + self.nrepeats
+
+NEWLINE = ord("\n")
+# character classes that contain "\n"
+NEWLINE_CATEGORIES = [sre_parse.CATEGORY_SPACE, sre_parse.CATEGORY_NOT_DIGIT, sre_parse.CATEGORY_NOT_WORD, sre_parse.CATEGORY_LINEBREAK]
+
+def set_matches_newline(items):
+    # items : [(op, av), ... ] of a parsed [...] set
+    negate = False
+    found = False
+    for op, av in items:
+        if op == sre_parse.NEGATE:
+            negate = True
+        elif op == sre_parse.LITERAL:
+            found = found or av == NEWLINE
+        elif op == sre_parse.RANGE:
+            found = found or av[0] <= NEWLINE <= av[1]
+        elif op == sre_parse.CATEGORY:
+            found = found or av in NEWLINE_CATEGORIES
+    return found != negate
+
+def can_match_newline(subpattern, dotall):
+    # True if any part of a parsed pattern, lookarounds included, can match
+    # "\n"; dotall : "." matches "\n"
+    for op, av in subpattern:
+        if op == sre_parse.LITERAL and av == NEWLINE:
+            return True
+        if op == sre_parse.NOT_LITERAL and av != NEWLINE:
+            return True
+        if op == sre_parse.ANY and dotall:
+            return True
+        if op == sre_parse.IN and set_matches_newline(av):
+            return True
+        if op == sre_parse.SUBPATTERN:
+            # (group, add_flags, del_flags, pattern), (group, pattern) before
+            # Python 3.6
+            inner = dotall
+            if len(av) == 4:
+                inner = (dotall or av[1] & re.DOTALL != 0) and av[2] & re.DOTALL == 0
+            if can_match_newline(av[-1], inner):
+                return True
+            continue
+        # repeats, branches, lookarounds, ...: whatever patterns they hold
+        values = list(av) if isinstance(av, (tuple, list)) else [av]
+        while len(values) > 0:
+            value = values.pop()
+            if isinstance(value, sre_parse.SubPattern):
+                if can_match_newline(value, dotall):
+                    return True
+            elif isinstance(value, (tuple, list)):
+                values.extend(value)
+    return False
+
+class RuleSet:
+    # rules compiled into one regex, see above
+    def __init__(self, rules):
+        self.rules = rules
+        alternatives = []
+        # groups : [[(renamed group, group name), ... ] of each rule]
+        self.groups = []
+        for i in range(0, len(rules)):
+            parsed = sre_parse.parse(rules[i].pattern)
+            state = parsed.state if hasattr(parsed, "state") else parsed.pattern
+            if can_match_newline(parsed, state.flags & re.DOTALL != 0):
+                raise ValueError("rule %d: pattern %r can match across lines (use [ \\t] for \\s, [^ \\n] for [^ ], ...)" % (i, rules[i].pattern))
+            prefix = "r%d_" % i
+            pattern = re.sub(r"\(\?P<(\w+)>", "(?P<" + prefix + r"\1>", rules[i].pattern)
+            if pattern.startswith("^"):
+                alternatives.append("(?P<r%d>%s)" % (i, pattern[1:]))
+            else:
+                # a greedy lookahead rejects lines without a match much faster
+                # than the lazy scan, which then finds the first occurrence
+                guard = re.sub(r"\(\?P<\w+>", "(?:", pattern)
+                alternatives.append("(?P<r%d>(?=[^\\n]*(?:%s))[^\\n]*?(?:%s))" % (i, guard, pattern))
+            self.groups.append([(prefix + name, name) for name in re.findall(r"\(\?P<(\w+)>", rules[i].pattern)])
+        alternation = "(?:" + "|".join(alternatives) + ")"
+        # the leading newline lets the regex engine jump from line to line
+        self.regex = re.compile(("\n" + alternation).encode("utf-8"))
+        self.first_line = re.compile(alternation.encode("utf-8"))
+        # rule_index[match.lastindex] : rule index of a match (the outermost
+        # group closes last)
+        self.rule_index = [None] * (self.regex.groups + 1)
+        for i in range(0, len(rules)):
+            self.rule_index[self.regex.groupindex["r%d" % i]] = i
+
+    def finditer(self, data):
+        # iterates over the matches of every matching line
+        match = self.first_line.match(data)
+        return itertools.chain([match] if match else [], self.regex.finditer(data))
+
+    def line_offset(self, match):
+        return match.start() if match.re is self.first_line else match.start() + 1
+
+def match_values(match, groups):
+    # {name: str or None, ... } of the groups of one rule in match
+    values = {}
+    for renamed, name in groups:
+        value = match.group(renamed)
+        values[name] = value.decode("utf-8", "replace") if value is not None else None
+    return values
+
+class LogIngest:
+    def __init__(self, header_rules, metric_rules, context = None):
+        # header_rules : [HeaderRule, ... ], the first match wins
+        self.header_rules = header_rules
+        # metric_rules : [MetricRule, ... ], the first match wins
+        self.metric_rules = metric_rules
+        # context : initial context values
+        self.context = context if context is not None else {}
+        # chunks of about this many bytes are handed to the workers (and read
+        # at a time when parsing serially)
+        self.chunk_size = 64 * 1024 * 1024
+        self.rule_set = RuleSet(header_rules + metric_rules)
+        self.header_rule_set = RuleSet(header_rules)
+
+    def parse_buffer(self, data, context, counts, df):
+        # runs the rules over the lines in data (bytes), starting from context
+        # and the metrics' window counts (both are updated)
+        num_headers = len(self.header_rules)
+        rules = self.rule_set.rules
+        groups = self.rule_set.groups
+        rule_index = self.rule_set.rule_index
+        value_groups = ["r%d_value" % i for i in range(0, len(rules))]
+        # windows[j] : (nskip, nskip + nrepeats) of metric j
+        windows = [(rule.nskip, rule.nskip + rule.nrepeats if rule.nrepeats is not None else len(data)) for rule in self.metric_rules]
+        # samples are gathered per cell (in first-seen order) and added at
+        # once; current[j] is the list of metric j under the current context
+        samples = {}
+        current = [None] * len(self.metric_rules)
+        for match in self.rule_set.finditer(data):
+            i = rule_index[match.lastindex]
+            if i < num_headers:
+                rule = rules[i]
+                rule.apply(match_values(match, groups[i]), context)
+                if rule.reset:
+                    counts[:] = [0] * len(counts)
+                current = [None] * len(self.metric_rules)
+                continue
+            j = i - num_headers
+            if current[j] is None:
+                rule = rules[i]
+                try:
+                    name = (rule.dtype.format(**context), rule.label.format(**context), rule.key.format(**context))
+                except KeyError:
+                    continue
+                current[j] = samples.setdefault(name, [])
+            count = counts[j] = counts[j] + 1
+            if windows[j][0] < count <= windows[j][1]:
+                value = match.group(value_groups[i])
+                current[j].append(float(value) if value else 0.0)
+        for name, values in samples.items():
+            df.add_many(name[0], name[1], name[2], values)
+        return df
+
+    def header_lines(self, path):
+        # [(offset, rule, values), ... ] of every header line of path, in order
+        headers = []
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return headers
+            data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                rule_set = self.header_rule_set
+                for match in rule_set.finditer(data):
+                    i = rule_set.rule_index[match.lastindex]
+                    headers.append((rule_set.line_offset(match), self.header_rules[i], match_values(match, rule_set.groups[i])))
+            finally:
+                data.close()
+        return headers
+
+    def split(self, path, num_chunks):
+        # [(start, end, context), ... ] covering path in about num_chunks
+        # pieces, cut at reset lines
+        size = os.path.getsize(path)
+        context = dict(self.context)
+        if num_chunks <= 1:
+            return [(0, size, context)]
+        chunks = []
+        start = 0
+        start_context = dict(context)
+        for offset, rule, values in self.header_lines(path):
+            if rule.reset and offset > start and offset >= (len(chunks) + 1) * size // num_chunks:
+                chunks.append((start, offset, start_context))
+                start = offset
+                start_context = dict(context)
+            rule.apply(values, context)
+        chunks.append((start, size, start_context))
+        return chunks
+
+    def parse_chunk(self, chunk):
+        path, start, end, context = chunk
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return self.parse_buffer(data, dict(context), [0] * len(self.metric_rules), dataframe())
+
+    def ingest(self, path, jobs = 1, df = None):
+        # parses path into df (a new dataframe if None) with jobs processes
+        if df is None:
+            df = dataframe()
+        if jobs <= 1:
+            context = dict(self.context)
+            counts = [0] * len(self.metric_rules)
+            rest = b""
+            with open(path, "rb") as f:
+                while True:
+                    block = f.read(self.chunk_size)
+                    if not block:
+                        break
+                    # the partial last line is parsed with the next block
+                    end = block.rfind(b"\n") + 1
+                    if end == 0:
+                        rest += block
+                        continue
+                    self.parse_buffer(rest + block[:end], context, counts, df)
+                    rest = block[end:]
+            self.parse_buffer(rest, context, counts, df)
+            return df
+        num_chunks = max(jobs, os.path.getsize(path) // self.chunk_size + 1)
+        chunks = [(path, start, end, context) for start, end, context in self.split(path, num_chunks)]
+        pool = multiprocessing.Pool(min(jobs, len(chunks)))
+        try:
+            # merged in file order, so that the result equals a serial parse.
+            # The merges only concatenate, so they run here, straight into df:
+            # handing them to the pool would pickle every partial there and
+            # back per round, a pairwise tree copies each sample per level
+            partials = pool.map(self.parse_chunk, chunks)
+            for partial in partials:
+                df.merge(partial)
+        finally:
+            pool.close()
+            pool.join()
+        return df
@@ -3,8 +3,15 @@ import re
 import sys
 import math
 
+import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D, TICKDOWN, TICKLEFT
+from matplotlib.markers import MarkerStyle
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
 
 ########################################################################################################################
 # Utils
@@ -67,6 +74,158 @@ def get_default_hatches(index):
 def get_default_fontsize():
     return 6.5
 
+def minmax_decimate(values, max_points):
+    # indices of the points to keep so that each of max_points / 2 equal
+    # columns keeps its minimum and maximum
+    values = np.asarray(values, dtype = np.float64)
+    num_values = len(values)
+    if num_values <= max_points:
+        return np.arange(num_values)
+    width = -(-num_values // max(max_points // 2, 1))
+    num_columns = -(-num_values // width)
+    columns = np.full(num_columns * width, np.nan)
+    columns[:num_values] = values
+    columns = columns.reshape(num_columns, width)
+    starts = np.arange(num_columns) * width
+    lows = np.argmin(np.where(np.isnan(columns), np.inf, columns), axis = 1) + starts
+    highs = np.argmax(np.where(np.isnan(columns), -np.inf, columns), axis = 1) + starts
+    keep = np.unique(np.concatenate((lows, highs, [0, num_values - 1])))
+    return keep[keep < num_values]
+
+def decimate_series(series, max_points):
+    # thin a LineSeries out to about max_points points (max_points : None = never)
+    if max_points == None or len(series.yvalues) <= max_points:
+        return series
+    keep = minmax_decimate(series.yvalues, max_points)
+    sys.stderr.write("%s: decimation dropped %d of %d points\n" % (series.label, len(series.yvalues) - len(keep), len(series.yvalues)))
+    return LineSeries(series.label, series.xvalues[keep], series.yvalues[keep], series.yvalue_errs[keep])
+
+########################################################################################################################
+# Report
+########################################################################################################################
+
+class PdfReport:
+    # A multi-page pdf the plot_* functions take in place of a filename; each
+    # chart becomes a page. The file is opened once and the fonts (subsets of
+    # the glyphs used on any page) are embedded once, when it is closed.
+    #
+    #   with PdfReport("report.pdf") as report:
+    #       plot_linechart(data, report)
+    #       plot_barchart(bar_data, report)
+    def __init__(self, filename):
+        self.filename = filename
+        self.pages = PdfPages(filename)
+        self.num_pages = 0
+        return
+
+    def savefig(self, fig, **kwargs):
+        self.pages.savefig(fig, **kwargs)
+        self.num_pages += 1
+
+    def close(self):
+        self.pages.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def set_font(family, size):
+    # set for every chart, even into the same PdfReport: other code may have
+    # changed the rc parameters since the last one
+    mpl.rc('font', family = family, size = size)
+
+def save_figure(fig, filename):
+    # filename : "path" | PdfReport. fig.savefig because plt.savefig draws
+    # the whole figure once more afterwards.
+    if isinstance(filename, PdfReport):
+        filename.savefig(fig, bbox_inches = 'tight', pad_inches = cm2in(0.1), dpi = 100)
+    else:
+        fig.savefig(filename, bbox_inches = 'tight', pad_inches = cm2in(0.1), dpi = 100)
+
+########################################################################################################################
+# Templates
+########################################################################################################################
+
+class FigureTemplate:
+    # A figure and its axes set up for one layout (size, axis formats and
+    # style): scales, ticks, limits, grid, spines and axis labels. A chart
+    # only adds its data artists, which clear() removes again.
+    def __init__(self, fig, ax):
+        self.fig = fig
+        self.ax = ax
+        return
+
+    def clear(self):
+        ax = self.ax
+        for artist in list(ax.lines) + list(ax.collections) + list(ax.patches) + list(ax.texts):
+            artist.remove()
+        del ax.containers[:]
+        if ax.get_legend() != None:
+            ax.get_legend().remove()
+        # autoscaled limits (the x axis of a bar chart) start over
+        ax.ignore_existing_data_limits = True
+
+class FigurePool:
+    # FigureTemplates by layout key, so that charts of the same layout reuse
+    # one figure instead of building and configuring a new one each. The
+    # least recently used template is dropped beyond max_templates; with
+    # max_templates = 0 nothing is pooled.
+    def __init__(self, max_templates = 8):
+        self.max_templates = max_templates
+        self.templates = {}
+        # keys, least recently used first
+        self.order = []
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def get(self, key, build):
+        # the template of key, cleared, or a new one from build()
+        template = self.templates.get(key)
+        if template != None:
+            self.order.remove(key)
+            self.order.append(key)
+            template.clear()
+            self.hits += 1
+            return template
+        self.misses += 1
+        template = build()
+        if self.max_templates > 0:
+            self.templates[key] = template
+            self.order.append(key)
+            while len(self.order) > self.max_templates:
+                del self.templates[self.order.pop(0)]
+        return template
+
+    def close(self):
+        self.templates = {}
+        self.order = []
+
+# the pool every plot_* function draws from
+figure_pool = FigurePool()
+
+def axis_format_key(axis_format):
+    if axis_format == None:
+        return None
+    return (axis_format.label, axis_format.min_value, axis_format.max_value, axis_format.mode, axis_format.tick, axis_format.minortick, axis_format.labelpad, axis_format.font_size)
+
+def new_figure(size):
+    # template figures are not registered with pyplot: as its current figure
+    # a cached one would take a caller's later plt.* calls into the next chart
+    fig = Figure(figsize = (cm2in(size[0]), cm2in(size[1])), dpi = 160, facecolor = 'w', edgecolor = 'k')
+    FigureCanvasAgg(fig)
+    return fig
+
+def layout_key(kind, data):
+    # everything a template of kind is set up from
+    key = [kind, tuple(data.size), data.font_name, data.font_size, axis_format_key(data.xaxis_format), axis_format_key(data.yaxis_format)]
+    for name in ["major_grid_linewidth", "major_grid_dashes", "minor_grid_linewidth", "minor_grid_dashes", "frame_border_width"]:
+        key.append(getattr(data, name))
+    return tuple(key)
+
 ########################################################################################################################
 # Line Chart
 ########################################################################################################################
@@ -132,6 +291,20 @@ class DataPoint:
         self.yvalue_err = yvalue_err
         return
 
+class LineSeries:
+    def __init__(self, label, xvalues, yvalues, yvalue_errs):
+        # label : "string"
+        self.label = label
+        # xvalues, yvalues, yvalue_errs : numpy arrays of the line's points
+        self.xvalues = xvalues
+        self.yvalues = yvalues
+        self.yvalue_errs = yvalue_errs
+        return
+
+    def has_errors(self):
+        errs = self.yvalue_errs
+        return bool(np.any((errs != 0.0) & ~np.isnan(errs)))
+
 class DataBar:
     def __init__(self, label, yvalue, yvalue_err):
         # label : "string"
@@ -154,14 +327,164 @@ class DataCategoryBar:
         self.yvalue_err = yvalue_err
         return
 
+class PointTable:
+    # [DataPoint | DataBar | DataCategoryBar, ... ] stored by column: label
+    # and category codes (names in first-seen order) plus float64 x, y and
+    # error arrays. Missing values (None, or the x of a bar) are nan, a
+    # missing category is -1. table[i] and iterating give PointRow views.
+    def __init__(self, capacity = 1024):
+        self.label_names = []
+        self.label_codes = {}
+        self.category_names = []
+        self.category_codes = {}
+        self.size = 0
+        self.columns = {
+            "label": np.zeros(capacity, dtype = np.int32),
+            "category": np.zeros(capacity, dtype = np.int32),
+            "xvalue": np.zeros(capacity, dtype = np.float64),
+            "yvalue": np.zeros(capacity, dtype = np.float64),
+            "yvalue_err": np.zeros(capacity, dtype = np.float64),
+        }
+        return
+
+    def reserve(self, size):
+        # room for size rows, doubling the capacity as it runs out
+        capacity = len(self.columns["label"])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype = column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def label_code(self, label):
+        code = self.label_codes.get(label)
+        if code is None:
+            code = self.label_codes[label] = len(self.label_names)
+            self.label_names.append(label)
+        return code
+
+    def category_code(self, category):
+        if category is None:
+            return -1
+        code = self.category_codes.get(category)
+        if code is None:
+            code = self.category_codes[category] = len(self.category_names)
+            self.category_names.append(category)
+        return code
+
+    def append(self, label, xvalue, yvalue, yvalue_err, category = None):
+        self.reserve(self.size + 1)
+        i = self.size
+        self.columns["label"][i] = self.label_code(label)
+        self.columns["category"][i] = self.category_code(category)
+        self.columns["xvalue"][i] = np.nan if xvalue is None else float(xvalue)
+        self.columns["yvalue"][i] = np.nan if yvalue is None else float(yvalue)
+        self.columns["yvalue_err"][i] = np.nan if yvalue_err is None else float(yvalue_err)
+        self.size += 1
+
+    def extend(self, label, xvalues, yvalues, yvalue_errs, category = None):
+        # appends a whole line (or run of bars) of one label at once; xvalues
+        # may be None for bars
+        yvalues = np.array(yvalues, dtype = np.float64)
+        start = self.size
+        end = start + len(yvalues)
+        self.reserve(end)
+        self.columns["label"][start:end] = self.label_code(label)
+        self.columns["category"][start:end] = self.category_code(category)
+        self.columns["xvalue"][start:end] = np.nan if xvalues is None else np.array(xvalues, dtype = np.float64)
+        self.columns["yvalue"][start:end] = yvalues
+        self.columns["yvalue_err"][start:end] = np.array(yvalue_errs, dtype = np.float64)
+        self.size = end
+
+    def column(self, name):
+        # "label" | "category" (codes) | "xvalue" | "yvalue" | "yvalue_err"
+        return self.columns[name][:self.size]
+
+    def row_labels(self):
+        return [self.label_names[code] for code in self.column("label").tolist()]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("PointTable index out of range")
+        return PointRow(self, index)
+
+    def __iter__(self):
+        for index in range(0, self.size):
+            yield PointRow(self, index)
+
+    def series(self):
+        # [LineSeries, ... ], one per label in first-seen order
+        codes = self.column("label")
+        order = np.argsort(codes, kind = "stable")
+        counts = np.bincount(codes, minlength = len(self.label_names))
+        ends = np.cumsum(counts)
+        xvalues = self.column("xvalue")[order]
+        yvalues = self.column("yvalue")[order]
+        yvalue_errs = self.column("yvalue_err")[order]
+        series = []
+        for code in range(0, len(self.label_names)):
+            if counts[code] > 0:
+                rows = slice(ends[code] - counts[code], ends[code])
+                series.append(LineSeries(self.label_names[code], xvalues[rows], yvalues[rows], yvalue_errs[rows]))
+        return series
+
+    @staticmethod
+    def from_objects(points):
+        # the PointTable of [DataPoint | DataBar | DataCategoryBar, ... ]
+        if isinstance(points, PointTable):
+            return points
+        table = PointTable(max(len(points), 1))
+        table.columns["label"][:len(points)] = [table.label_code(point.label) for point in points]
+        table.columns["category"][:len(points)] = [table.category_code(getattr(point, "category", None)) for point in points]
+        table.columns["xvalue"][:len(points)] = np.array([getattr(point, "xvalue", None) for point in points], dtype = np.float64)
+        table.columns["yvalue"][:len(points)] = np.array([point.yvalue for point in points], dtype = np.float64)
+        table.columns["yvalue_err"][:len(points)] = np.array([point.yvalue_err for point in points], dtype = np.float64)
+        table.size = len(points)
+        return table
+
+class PointRow(object):
+    # row index of a PointTable, read like a DataPoint / DataBar / DataCategoryBar
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def label(self):
+        return self.table.label_names[self.table.columns["label"][self.index]]
+
+    @property
+    def category(self):
+        code = self.table.columns["category"][self.index]
+        return self.table.category_names[code] if code >= 0 else None
+
+    @property
+    def xvalue(self):
+        return float(self.table.columns["xvalue"][self.index])
+
+    @property
+    def yvalue(self):
+        return float(self.table.columns["yvalue"][self.index])
+
+    @property
+    def yvalue_err(self):
+        return float(self.table.columns["yvalue_err"][self.index])
+
 class LineChartData:
     def __init__(self, points, line_formats, xaxis_format, yaxis_format, size):
-        # points : [DataPoint, ... ]
+        # points : [DataPoint, ... ] | PointTable
         self.points = points
-        self.labels = []
-        for point in points:
-             if not point.label in self.labels:
-                self.labels.append(point.label)
+        # series : [LineSeries, ... ], one per label in first-seen order
+        self.series = PointTable.from_objects(points).series()
+        self.labels = [series.label for series in self.series]
         # line_formats : {label: LineFormat, ... }
         self.line_formats = line_formats
         # xaxis_format : AxisFormat
@@ -170,6 +493,10 @@ class LineChartData:
         self.yaxis_format = yaxis_format
         # size : (width, height)
         self.size = size
+        # max_points : lines with more points are decimated (None = never)
+        self.max_points = None
+        # title : "string" | None, shown on the panel by plot_linecharts
+        self.title = None
         self.legend_labelspacing = 0
         self.legend_fontsize = 0.85 * get_default_fontsize()
         self.legend_location = "upper left" # "best"
@@ -187,7 +514,7 @@ class LineChartData:
 
 class BarChartData:
     def __init__(self, bars, xaxis_format, yaxis_format, size):
-        # points : [DataBar, ... ]
+        # bars : [DataBar, ... ] | PointTable
         self.bars = bars
         # xaxis_format : AxisFormat
         self.xaxis_format = xaxis_format
@@ -214,7 +541,7 @@ class BarChartData:
 
 class CategoryBarChartData:
     def __init__(self, bars, xaxis_format, yaxis_format, size):
-        # points : [DataBar, ... ]
+        # bars : [DataCategoryBar, ... ] | PointTable
         self.bars = bars
         # xaxis_format : AxisFormat
         self.xaxis_format = xaxis_format
@@ -246,226 +573,311 @@ class CategoryBarChartData:
         self.hatch_indices = range(0, 20)
         return
 
-def plot_linechart(data, filename):
-    # data : LineChartData
-    assert (data.yaxis_format.mode != "label"), 'yaxis may not be "label".'
-    assert (data.xaxis_format.mode != "label"), 'xaxis_format + "label" is not supported.'
-
-    mpl.rc('font', family = data.font_name, size = data.font_size)
-
-    fig = plt.figure(figsize = (cm2in(data.size[0]), cm2in(data.size[1])), dpi = 160, facecolor = 'w', edgecolor = 'k')
-    plt.minorticks_on()
-
-    if data.xaxis_format.mode == "log":
-        plt.xscale('log')
-    elif data.xaxis_format.mode == "linear":
-        plt.xticks([data.xaxis_format.min_value + x * data.xaxis_format.tick for x in range(0, int((data.xaxis_format.max_value - data.xaxis_format.min_value) / data.xaxis_format.tick + 1))])
-    if data.yaxis_format.mode == "log":
-        plt.yscale('log')
-        plt.yticks([10 ** y  for y in range((int(math.ceil(math.log10(data.yaxis_format.min_value))) / data.yaxis_format.tick) * data.yaxis_format.tick, int(math.floor(math.log10(data.yaxis_format.max_value))) + 1, data.yaxis_format.tick)])
-    elif data.yaxis_format.mode == "linear":
-        plt.yticks([data.yaxis_format.min_value + y * data.yaxis_format.tick for y in range(0, int((data.yaxis_format.max_value - data.yaxis_format.min_value) / data.yaxis_format.tick + 1))])
-    # fig.get_frame().set_linewidth(data.figure_border_width)
-    plt.xlim(xmin = data.xaxis_format.min_value, xmax = data.xaxis_format.max_value)
-    plt.ylim(ymin = data.yaxis_format.min_value, ymax = data.yaxis_format.max_value)
-
-    if data.yaxis_format.mode == "linear":
-        plt.axes().yaxis.set_minor_locator(plt.MultipleLocator(base = data.yaxis_format.minortick))
-
-    plt.grid(which = 'major', linestyle = '--', linewidth = data.major_grid_linewidth, dashes = data.major_grid_dashes, color = 'black')
-    plt.grid(which = 'minor', linestyle = '--', linewidth = data.minor_grid_linewidth, dashes = data.minor_grid_dashes, color = 'black')
-    for axis in ['top','bottom','left','right']:
-        plt.gca().spines[axis].set_linewidth(data.frame_border_width)
-
-    # get all labels
+def get_line_formats(data):
+    # [LineFormat, ... ] of data.series: data.line_formats[label] if given,
+    # else the next ideal (for "ideal" labels) or default format
+    line_formats = []
     line_index = 0
     ideal_index = 0
-    for label in data.labels:
-        xvalues = [point.xvalue for point in data.points if point.label == label]
-        yvalues = [point.yvalue for point in data.points if point.label == label]
-        yvalue_errs = [point.yvalue_err for point in data.points if point.label == label]
+    for series in data.series:
+        label = series.label
         if not label in data.line_formats:
             if "ideal" in label or "Ideal" in label:
-                line_format = LineFormat.get_ideal(ideal_index)
+                line_formats.append(LineFormat.get_ideal(ideal_index))
                 ideal_index += 1
             else:
-                line_format = LineFormat.get_default(line_index)
+                line_formats.append(LineFormat.get_default(line_index))
                 line_index += 1
         else:
-            line_format = data.line_formats[label]
-        plt.plot(xvalues, yvalues, label = label, marker = line_format.marker, fillstyle = "none", color = line_format.color, markersize = line_format.markersize, linewidth = line_format.linewidth, linestyle = line_format.get_linestyle())
-        if any([(yvalue_err != None and yvalue_err != 0.0) for yvalue_err in yvalue_errs]):
-            plt.errorbar(xvalues, yvalues, yerr = [yvalue_errs, yvalue_errs], fmt = "none", ecolor = line_format.color, elinewidth = line_format.errorbar_width, capsize = line_format.errorbar_capsize, capthick = line_format.errorbar_capthick)
+            line_formats.append(data.line_formats[label])
+    return line_formats
+
+def axis_ticks(axis_format, axis):
+    # major ticks of an AxisFormat ("x" | "y" axis), None = the scale's own.
+    # A "log" y axis has a tick every axis_format.tick decades.
+    if axis_format.mode == "linear":
+        return [axis_format.min_value + i * axis_format.tick for i in range(0, int((axis_format.max_value - axis_format.min_value) / axis_format.tick + 1))]
+    if axis_format.mode == "log" and axis == "y":
+        return [10 ** i for i in range((int(math.ceil(math.log10(axis_format.min_value))) // axis_format.tick) * axis_format.tick, int(math.floor(math.log10(axis_format.max_value))) + 1, axis_format.tick)]
+    return None
+
+def set_axes_format(ax, xaxis_format, yaxis_format, xticks = None, yticks = None):
+    # scales, ticks and limits of ax; xticks, yticks : (major, minor) tick
+    # locations to fix instead of locating them from the formats, the minor
+    # ones being left to plot_grid_bulk
+    if xaxis_format.mode == "log":
+        ax.set_xscale('log')
+    if yaxis_format.mode == "log":
+        ax.set_yscale('log')
+    if xticks == None:
+        ax.minorticks_on()
+        ticks = axis_ticks(xaxis_format, "x")
+        if ticks != None:
+            ax.set_xticks(ticks)
+    else:
+        ax.xaxis.set_major_locator(plt.FixedLocator(xticks[0]))
+        ax.xaxis.set_minor_locator(plt.NullLocator())
+    if yticks == None:
+        ax.minorticks_on()
+        ticks = axis_ticks(yaxis_format, "y")
+        if ticks != None:
+            ax.set_yticks(ticks)
+        if yaxis_format.mode == "linear":
+            ax.yaxis.set_minor_locator(plt.MultipleLocator(base = yaxis_format.minortick))
+    else:
+        ax.yaxis.set_major_locator(plt.FixedLocator(yticks[0]))
+        ax.yaxis.set_minor_locator(plt.NullLocator())
+    ax.set_xlim(xaxis_format.min_value, xaxis_format.max_value)
+    ax.set_ylim(yaxis_format.min_value, yaxis_format.max_value)
+
+def plot_grid_bulk(ax, data, xticks, yticks):
+    # the grid lines and minor tick marks of ax at xticks, yticks : (major,
+    # minor) locations, as a few collections rather than a Tick (with its
+    # own grid line) per location
+    xlimits = sorted(ax.get_xlim())
+    ylimits = sorted(ax.get_ylim())
+    xticks = [[x for x in ticks if xlimits[0] <= x <= xlimits[1]] for ticks in xticks]
+    yticks = [[y for y in ticks if ylimits[0] <= y <= ylimits[1]] for ticks in yticks]
+    widths = [data.major_grid_linewidth] * len(xticks[0]) + [data.minor_grid_linewidth] * len(xticks[1])
+    linestyles = [(0, data.major_grid_dashes)] * len(xticks[0]) + [(0, data.minor_grid_dashes)] * len(xticks[1])
+    ax.add_collection(LineCollection([[(x, 0), (x, 1)] for x in xticks[0] + xticks[1]], transform = ax.get_xaxis_transform(), colors = 'black', linewidths = widths, linestyles = linestyles, zorder = 1.5), autolim = False)
+    widths = [data.major_grid_linewidth] * len(yticks[0]) + [data.minor_grid_linewidth] * len(yticks[1])
+    linestyles = [(0, data.major_grid_dashes)] * len(yticks[0]) + [(0, data.minor_grid_dashes)] * len(yticks[1])
+    ax.add_collection(LineCollection([[(0, y), (1, y)] for y in yticks[0] + yticks[1]], transform = ax.get_yaxis_transform(), colors = 'black', linewidths = widths, linestyles = linestyles, zorder = 1.5), autolim = False)
+    # minor tick marks: the markers matplotlib draws them with
+    ax.scatter(xticks[1], [0] * len(xticks[1]), transform = ax.get_xaxis_transform(), marker = TICKDOWN, s = mpl.rcParams["xtick.minor.size"] ** 2, linewidths = mpl.rcParams["xtick.minor.width"], c = mpl.rcParams["xtick.color"], clip_on = False, zorder = 2.5)
+    ax.scatter([0] * len(yticks[1]), yticks[1], transform = ax.get_yaxis_transform(), marker = TICKLEFT, s = mpl.rcParams["ytick.minor.size"] ** 2, linewidths = mpl.rcParams["ytick.minor.width"], c = mpl.rcParams["ytick.color"], clip_on = False, zorder = 2.5)
+
+def plot_series_bulk(ax, series_list, line_formats):
+    # draws [LineSeries, ... ] on ax with a handful of collections (the lines
+    # of each line style, the markers of each marker, the error bars) rather
+    # than a Line2D and an errorbar container per series
+    lines_by_style = {}
+    markers_by_style = {}
+    errorbars = []
+    for i in range(0, len(series_list)):
+        series = series_list[i]
+        line_format = line_formats[i]
+        color = mpl.colors.to_rgba(line_format.color)
+        xy = np.column_stack((series.xvalues, series.yvalues)).astype(np.float64)
+        lines_by_style.setdefault(line_format.get_linestyle(), []).append((xy, color, line_format.linewidth))
+        if line_format.marker != "" and line_format.marker != None:
+            markers_by_style.setdefault((line_format.marker, line_format.markersize), []).append((xy, color))
+        if series.has_errors():
+            errorbars.append((series, color, line_format))
+    for linestyle, lines in lines_by_style.items():
+        ax.add_collection(LineCollection([xy for xy, color, linewidth in lines], colors = [color for xy, color, linewidth in lines], linewidths = [linewidth for xy, color, linewidth in lines], linestyles = linestyle, capstyle = mpl.rcParams["lines.solid_capstyle"], joinstyle = mpl.rcParams["lines.solid_joinstyle"], zorder = 2), autolim = False)
+    for (marker, markersize), points in markers_by_style.items():
+        xy = np.concatenate([xy for xy, color in points])
+        colors = np.concatenate([np.tile(color, (len(xy), 1)) for xy, color in points])
+        if MarkerStyle(marker).is_filled():
+            # fillstyle = "none": hollow markers in the line's color
+            ax.scatter(xy[:, 0], xy[:, 1], s = markersize ** 2, marker = marker, facecolors = "none", edgecolors = colors, linewidths = mpl.rcParams["lines.markeredgewidth"], zorder = 2)
+        else:
+            ax.scatter(xy[:, 0], xy[:, 1], s = markersize ** 2, marker = marker, c = colors, linewidths = mpl.rcParams["lines.markeredgewidth"], zorder = 2)
+    if len(errorbars) == 0:
+        return
+    # bars: one segment per point; caps: a "_" marker at both ends
+    segments = []
+    colors = []
+    widths = []
+    caps = []
+    cap_colors = []
+    cap_sizes = []
+    cap_widths = []
+    for series, color, line_format in errorbars:
+        valid = ~np.isnan(series.yvalue_errs) & (series.yvalue_errs != 0.0)
+        xvalues = series.xvalues[valid].astype(np.float64)
+        lows = series.yvalues[valid] - series.yvalue_errs[valid]
+        highs = series.yvalues[valid] + series.yvalue_errs[valid]
+        segments.append(np.stack((np.column_stack((xvalues, lows)), np.column_stack((xvalues, highs))), axis = 1))
+        colors += [color] * len(xvalues)
+        widths += [line_format.errorbar_width] * len(xvalues)
+        if line_format.errorbar_capsize > 0:
+            caps.append(np.column_stack((np.concatenate((xvalues, xvalues)), np.concatenate((lows, highs)))))
+            cap_colors += [color] * (2 * len(xvalues))
+            cap_sizes += [(2 * line_format.errorbar_capsize) ** 2] * (2 * len(xvalues))
+            cap_widths += [line_format.errorbar_capthick] * (2 * len(xvalues))
+    ax.add_collection(LineCollection(np.concatenate(segments), colors = colors, linewidths = widths, zorder = 2), autolim = False)
+    if len(caps) > 0:
+        caps = np.concatenate(caps)
+        ax.scatter(caps[:, 0], caps[:, 1], s = cap_sizes, marker = "_", c = cap_colors, linewidths = cap_widths, zorder = 2)
+
+def linechart_template(data):
+    fig = new_figure(data.size)
+    ax = fig.add_subplot(111)
+    set_axes_format(ax, data.xaxis_format, data.yaxis_format)
+    # fig.get_frame().set_linewidth(data.figure_border_width)
+    ax.grid(which = 'major', linestyle = '--', linewidth = data.major_grid_linewidth, dashes = data.major_grid_dashes, color = 'black')
+    ax.grid(which = 'minor', linestyle = '--', linewidth = data.minor_grid_linewidth, dashes = data.minor_grid_dashes, color = 'black')
+    for axis in ['top','bottom','left','right']:
+        ax.spines[axis].set_linewidth(data.frame_border_width)
     if data.xaxis_format.label != None and data.xaxis_format.label != "":
-        plt.xlabel(data.xaxis_format.label, fontsize = data.xaxis_format.font_size, labelpad = data.xaxis_format.labelpad)
+        ax.set_xlabel(data.xaxis_format.label, fontsize = data.xaxis_format.font_size, labelpad = data.xaxis_format.labelpad)
     if data.yaxis_format.label != None and data.yaxis_format.label != "":
-        plt.ylabel(data.yaxis_format.label, fontsize = data.yaxis_format.font_size, labelpad = data.yaxis_format.labelpad)
-    legend = plt.legend(loc = data.legend_location, frameon=True, fontsize = data.legend_fontsize, labelspacing = data.legend_labelspacing, ncol = data.legend_ncolumns)
+        ax.set_ylabel(data.yaxis_format.label, fontsize = data.yaxis_format.font_size, labelpad = data.yaxis_format.labelpad)
+    return FigureTemplate(fig, ax)
+
+def plot_linechart(data, filename):
+    # data : LineChartData
+    # filename : "path" | PdfReport (as for every plot_* function)
+    assert (data.yaxis_format.mode != "label"), 'yaxis may not be "label".'
+    assert (data.xaxis_format.mode != "label"), 'xaxis_format + "label" is not supported.'
+
+    set_font(data.font_name, data.font_size)
+
+    template = figure_pool.get(layout_key("linechart", data), lambda: linechart_template(data))
+    ax = template.ax
+
+    # get all labels
+    line_formats = get_line_formats(data)
+    for series_index in range(0, len(data.series)):
+        series = decimate_series(data.series[series_index], data.max_points)
+        label = series.label
+        line_format = line_formats[series_index]
+        ax.plot(series.xvalues, series.yvalues, label = label, marker = line_format.marker, fillstyle = "none", color = line_format.color, markersize = line_format.markersize, linewidth = line_format.linewidth, linestyle = line_format.get_linestyle())
+        if series.has_errors():
+            ax.errorbar(series.xvalues, series.yvalues, yerr = series.yvalue_errs, fmt = "none", ecolor = line_format.color, elinewidth = line_format.errorbar_width, capsize = line_format.errorbar_capsize, capthick = line_format.errorbar_capthick)
+    legend = ax.legend(loc = data.legend_location, frameon=True, fontsize = data.legend_fontsize, labelspacing = data.legend_labelspacing, ncol = data.legend_ncolumns)
     legend.get_frame().set_linewidth(data.legend_border_width)
-    plt.savefig(filename, bbox_inches = 'tight', pad_inches = cm2in(0.1), dpi = 100)
-    plt.close(fig)
+    save_figure(template.fig, filename)
 
-def plot_linecharts(data_list, filename):
+def plot_linecharts(data_list, filename, ncolumns = 3):
+    # data_list : [LineChartData, ... ], drawn as panels of a grid with
+    #             ncolumns columns, row by row. Every panel gets the axes of
+    #             data_list[0] (formats and limits); its size is the figure's.
     data = data_list[0]
-    # data : LineChartData
     assert (data.yaxis_format.mode != "label"), 'yaxis may not be "label".'
     assert (data.xaxis_format.mode != "label"), 'xaxis_format + "label" is not supported.'
 
-    mpl.rc('font', family = data.font_name, size = data.font_size)
+    set_font(data.font_name, data.font_size)
 
-    fig = plt.figure(figsize = (cm2in(data.size[0]), cm2in(data.size[1])), dpi = 160, facecolor = 'w', edgecolor = 'k')
-    # fig = plt.figure(1)
-    plt.minorticks_on()
+    nrows = (len(data_list) + ncolumns - 1) // ncolumns
+    # the axes are not shared (matplotlib's sharing costs quadratic time in
+    # the number of panels): the ticks are located once, on the first panel,
+    # then fixed on every panel, and only the outer panels format labels
+    fig, axes = plt.subplots(nrows, ncolumns, squeeze = False, figsize = (cm2in(data.size[0]), cm2in(data.size[1])), dpi = 160, facecolor = 'w', edgecolor = 'k')
+    xaxis_format = data.xaxis_format
+    yaxis_format = data.yaxis_format
+    ax = axes[0][0]
+    set_axes_format(ax, xaxis_format, yaxis_format)
+    xticks = (ax.xaxis.get_majorticklocs().tolist(), ax.xaxis.get_minorticklocs().tolist())
+    yticks = (ax.yaxis.get_majorticklocs().tolist(), ax.yaxis.get_minorticklocs().tolist())
 
-    for data_index in range(0, 9):
+    # legend entries of every label, in first-seen order over the panels
+    legend_handles = []
+    legend_labels = {}
+    for data_index in range(0, nrows * ncolumns):
+        data_index_y = data_index // ncolumns
+        data_index_x = data_index % ncolumns
+        ax = axes[data_index_y][data_index_x]
+        if data_index >= len(data_list):
+            ax.set_visible(False)
+            continue
+        set_axes_format(ax, xaxis_format, yaxis_format, xticks, yticks)
+        if data_index_y != nrows - 1 and data_index + ncolumns < len(data_list):
+            ax.xaxis.set_major_formatter(plt.NullFormatter())
+            ax.xaxis.set_minor_formatter(plt.NullFormatter())
+            ax.xaxis.set_tick_params(which = 'both', labelbottom = False)
+        if data_index_x != 0:
+            ax.yaxis.set_major_formatter(plt.NullFormatter())
+            ax.yaxis.set_minor_formatter(plt.NullFormatter())
+            ax.yaxis.set_tick_params(which = 'both', labelleft = False)
         data = data_list[data_index]
-        data_index_y = data_index / 3
-        data_index_x = data_index % 3
-        ax = plt.subplot(331 + data_index)
-        # plt.plot(t, s1)
-
-        if data.xaxis_format.mode == "log":
-            plt.xscale('log')
-            if data_index_y != 2:
-                plt.xticks([1, 10, 100], " ")
-            else:
-                plt.xticks([1, 10, 100])
-        elif data.xaxis_format.mode == "linear":
-            if data_index_y != 2:
-                plt.xticks([data.xaxis_format.min_value + x * data.xaxis_format.tick for x in range(0, int((data.xaxis_format.max_value - data.xaxis_format.min_value) / data.xaxis_format.tick + 1))], " ")
-            else:
-                plt.xticks([data.xaxis_format.min_value + x * data.xaxis_format.tick for x in range(0, int((data.xaxis_format.max_value - data.xaxis_format.min_value) / data.xaxis_format.tick + 1))])
-        if data.yaxis_format.mode == "log":
-            plt.yscale('log')
-            if data_index_x != 0:
-                plt.yticks([10 ** y  for y in range((int(math.ceil(math.log10(data.yaxis_format.min_value))) / data.yaxis_format.tick) * data.yaxis_format.tick, int(math.floor(math.log10(data.yaxis_format.max_value))) + 1, data.yaxis_format.tick)], " ")
-            else:
-                plt.yticks([10 ** y  for y in range((int(math.ceil(math.log10(data.yaxis_format.min_value))) / data.yaxis_format.tick) * data.yaxis_format.tick, int(math.floor(math.log10(data.yaxis_format.max_value))) + 1, data.yaxis_format.tick)])
-        elif data.yaxis_format.mode == "linear":
-            if data_index_x != 0:
-                plt.yticks([data.yaxis_format.min_value + y * data.yaxis_format.tick for y in range(0, int((data.yaxis_format.max_value - data.yaxis_format.min_value) / data.yaxis_format.tick + 1))], " ")
-            else:
-                plt.yticks([data.yaxis_format.min_value + y * data.yaxis_format.tick for y in range(0, int((data.yaxis_format.max_value - data.yaxis_format.min_value) / data.yaxis_format.tick + 1))])
-
-        # fig.get_frame().set_linewidth(data.figure_border_width)
-        [i.set_linewidth(data.figure_border_width) for i in ax.spines.itervalues()]
-        # ax.get_frame().set_linewidth()
-        plt.xlim(xmin = data.xaxis_format.min_value, xmax = data.xaxis_format.max_value)
-        plt.ylim(ymin = data.yaxis_format.min_value, ymax = data.yaxis_format.max_value)
-
-        if data.yaxis_format.mode == "linear":
-            ax.yaxis.set_minor_locator(plt.MultipleLocator(base = data.yaxis_format.minortick))
-
-        plt.grid(which = 'major', linestyle = '--', linewidth = data.major_grid_linewidth, dashes = data.major_grid_dashes, color = 'black')
-        plt.grid(which = 'minor', linestyle = '--', linewidth = data.minor_grid_linewidth, dashes = data.minor_grid_dashes, color = 'black')
-
-        # for axis in ['top','bottom','left','right']:
-        #     plt.gca().spines[axis].set_linewidth(data.frame_border_width)
-
-        # get all labels
-        line_index = 0
-        ideal_index = 0
-        for label in data.labels:
-            xvalues = [point.xvalue for point in data.points if point.label == label]
-            yvalues = [point.yvalue for point in data.points if point.label == label]
-            yvalue_errs = [point.yvalue_err for point in data.points if point.label == label]
-            if not label in data.line_formats:
-                if "ideal" in label or "Ideal" in label:
-                    line_format = LineFormat.get_ideal(ideal_index)
-                    ideal_index += 1
-                else:
-                    line_format = LineFormat.get_default(line_index)
-                    line_index += 1
-            else:
-                line_format = data.line_formats[label]
-            plt.plot(xvalues, yvalues, label = label, marker = line_format.marker, fillstyle = "none", color = line_format.color, markersize = line_format.markersize, linewidth = line_format.linewidth, linestyle = line_format.get_linestyle())
-            if any([(yvalue_err != None and yvalue_err != 0.0) for yvalue_err in yvalue_errs]):
-                plt.errorbar(xvalues, yvalues, yerr = [yvalue_errs, yvalue_errs], fmt = "none", ecolor = line_format.color, elinewidth = line_format.errorbar_width, capsize = line_format.errorbar_capsize, capthick = line_format.errorbar_capthick)
-        if data_index_y == 2 and data.xaxis_format.label != None and data.xaxis_format.label != "":
-            plt.xlabel(data.xaxis_format.label, fontsize = data.xaxis_format.font_size, labelpad = data.xaxis_format.labelpad)
-        plt.title(data.title, fontweight='bold', fontsize = data.xaxis_format.font_size * 0.9, position=(0.5, 0.78), bbox=dict(facecolor='white', alpha=1.0, lw=0.0, pad=1.5))
+        for spine in ax.spines.values():
+            spine.set_linewidth(data.figure_border_width)
+        plot_grid_bulk(ax, data, xticks, yticks)
 
-        if data_index_x == 0 and data_index_y == 1 and data.yaxis_format.label != None and data.yaxis_format.label != "":
-            plt.ylabel(data.yaxis_format.label.replace("\n", " "), fontsize = data.yaxis_format.font_size, labelpad = data.yaxis_format.labelpad)
+        line_formats = get_line_formats(data)
+        plot_series_bulk(ax, [decimate_series(series, data.max_points) for series in data.series], line_formats)
+        for series_index in range(0, len(data.series)):
+            label = data.series[series_index].label
+            if not label in legend_labels:
+                legend_labels[label] = True
+                line_format = line_formats[series_index]
+                legend_handles.append(Line2D([], [], label = label, marker = line_format.marker, fillstyle = "none", color = line_format.color, markersize = line_format.markersize, linewidth = line_format.linewidth, linestyle = line_format.get_linestyle()))
 
-    data = data_list[data_index]
+        if (data_index_y == nrows - 1 or data_index + ncolumns >= len(data_list)) and data.xaxis_format.label != None and data.xaxis_format.label != "":
+            ax.set_xlabel(data.xaxis_format.label, fontsize = data.xaxis_format.font_size, labelpad = data.xaxis_format.labelpad)
+        if data.title != None:
+            ax.set_title(data.title, fontweight='bold', fontsize = data.xaxis_format.font_size * 0.9, y = 0.78, bbox=dict(facecolor='white', alpha=1.0, lw=0.0, pad=1.5))
+        if data_index_x == 0 and data_index_y == nrows // 2 and data.yaxis_format.label != None and data.yaxis_format.label != "":
+            ax.set_ylabel(data.yaxis_format.label.replace("\n", " "), fontsize = data.yaxis_format.font_size, labelpad = data.yaxis_format.labelpad)
 
-    legend = plt.legend(bbox_to_anchor=(1.5, 2.0), frameon=True, fontsize = data.legend_fontsize, labelspacing = data.legend_labelspacing + 1,  ncol = 1)
+    data = data_list[0]
+    legend = fig.legend(handles = legend_handles, loc = 'center left', bbox_to_anchor = (0.96, 0.5), frameon=True, fontsize = data.legend_fontsize, labelspacing = data.legend_labelspacing + 1, ncol = 1)
     legend.get_frame().set_linewidth(data.legend_border_width)
 
     plt.subplots_adjust(top=0.92, bottom=0.08, left=0.10, right=0.95, hspace=0.05, wspace=0.10)
 
-    plt.savefig(filename, bbox_inches = 'tight', pad_inches = cm2in(0.1), dpi = 100)
+    # one grid per call: not worth pooling
+    save_figure(fig, filename)
     plt.close(fig)
 
+def barchart_template(data, grid_zorder = None):
+    # the y axis of a (category) bar chart; its x axis depends on the bars
+    fig = new_figure(data.size)
+    ax = fig.add_subplot(111)
+    if data.yaxis_format.mode == "log":
+        ax.set_yscale('log')
+    ticks = axis_ticks(data.yaxis_format, "y")
+    if ticks != None:
+        ax.set_yticks(ticks)
+    # fig.get_frame().set_linewidth(data.figure_border_width)
+    ax.set_ylim(data.yaxis_format.min_value, data.yaxis_format.max_value)
+    ax.minorticks_on()
+    ax.yaxis.grid(which = 'major', linestyle = '--', linewidth = data.major_grid_linewidth, dashes = data.major_grid_dashes, color = 'black', zorder = grid_zorder)
+    ax.yaxis.grid(which = 'minor', linestyle = '--', linewidth = data.minor_grid_linewidth, dashes = data.minor_grid_dashes, color = 'black', zorder = grid_zorder)
+    for axis in ['top','bottom','left','right']:
+        ax.spines[axis].set_linewidth(data.frame_border_width)
+    if data.yaxis_format.label != None and data.yaxis_format.label != "":
+        ax.set_ylabel(data.yaxis_format.label, fontsize = data.yaxis_format.font_size, labelpad = data.yaxis_format.labelpad)
+    return FigureTemplate(fig, ax)
+
 def plot_barchart(data, filename):
     assert (data.yaxis_format.mode != "label"), 'yaxis may not be "label".'
 
-    mpl.rc('font', family = data.font_name, size = data.font_size)
+    set_font(data.font_name, data.font_size)
 
-    fig = plt.figure(figsize = (cm2in(data.size[0]), cm2in(data.size[1])), dpi = 160, facecolor = 'w', edgecolor = 'k')
-    if data.yaxis_format.mode == "log":
-        plt.yscale('log')
-        plt.yticks([10 ** y  for y in range((int(math.ceil(math.log10(data.yaxis_format.min_value))) / data.yaxis_format.tick) * data.yaxis_format.tick, int(math.floor(math.log10(data.yaxis_format.max_value))) + 1, data.yaxis_format.tick)])
-    elif data.yaxis_format.mode == "linear":
-        plt.yticks([data.yaxis_format.min_value + y * data.yaxis_format.tick for y in range(0, int((data.yaxis_format.max_value - data.yaxis_format.min_value) / data.yaxis_format.tick + 1))])
-    # fig.get_frame().set_linewidth(data.figure_border_width)
-    plt.ylim(ymin = data.yaxis_format.min_value, ymax = data.yaxis_format.max_value)
-    plt.minorticks_on()
-    plt.gca().yaxis.grid(which = 'major', linestyle = '--', linewidth = data.major_grid_linewidth, dashes = data.major_grid_dashes, color = 'black')
-    plt.gca().yaxis.grid(which = 'minor', linestyle = '--', linewidth = data.minor_grid_linewidth, dashes = data.minor_grid_dashes, color = 'black')
-    for axis in ['top','bottom','left','right']:
-        plt.gca().spines[axis].set_linewidth(data.frame_border_width)
+    template = figure_pool.get(layout_key("barchart", data), lambda: barchart_template(data))
+    ax = template.ax
 
     # get all bars
-    plt_bars = plt.bar(range(0, len(data.bars)), [bar.yvalue for bar in data.bars], width = data.barwidth, align = 'center', linewidth = 0)
-    plt.errorbar([bar_index for bar_index in range(0, len(data.bars))], [bar.yvalue for bar in data.bars], yerr = [[bar.yvalue_err for bar in data.bars], [bar.yvalue_err for bar in data.bars]], fmt = "none", ecolor = data.errorbar_color, elinewidth = data.errorbar_width, capsize = data.errorbar_capsize, capthick = data.errorbar_capthick)
-    for bar_index in range(0, len(data.bars)):
+    bars = PointTable.from_objects(data.bars)
+    yvalues = bars.column("yvalue")
+    yvalue_errs = bars.column("yvalue_err")
+    plt_bars = ax.bar(range(0, len(bars)), yvalues, width = data.barwidth, align = 'center', linewidth = 0)
+    ax.errorbar(range(0, len(bars)), yvalues, yerr = [yvalue_errs, yvalue_errs], fmt = "none", ecolor = data.errorbar_color, elinewidth = data.errorbar_width, capsize = data.errorbar_capsize, capthick = data.errorbar_capthick)
+    for bar_index in range(0, len(bars)):
         plt_bars[bar_index].set_color(get_default_colors(bar_index))
-    plt.xticks([bar_index for bar_index in range(0, len(data.bars))], [bar.label for bar in data.bars], rotation = data.xaxis_rotation)
+    ax.set_xticks(range(0, len(bars)))
+    ax.set_xticklabels(bars.row_labels(), rotation = data.xaxis_rotation)
 
-    if data.yaxis_format.label != None and data.yaxis_format.label != "":
-        plt.ylabel(data.yaxis_format.label, fontsize = data.yaxis_format.font_size, labelpad = data.yaxis_format.labelpad)
-    plt.savefig(filename, bbox_inches = 'tight', pad_inches = cm2in(0.1), dpi = 100)
-    plt.close(fig)
+    save_figure(template.fig, filename)
 
 def plot_categorybarchart(data, filename):
     assert (data.yaxis_format.mode != "label"), 'yaxis may not be "label".'
 
-    mpl.rc('font', family = data.font_name, size = data.font_size)
+    set_font(data.font_name, data.font_size)
 
-    fig = plt.figure(figsize = (cm2in(data.size[0]), cm2in(data.size[1])), dpi = 160, facecolor = 'w', edgecolor = 'k')
-    if data.yaxis_format.mode == "log":
-        plt.yscale('log')
-        plt.yticks([10 ** y  for y in range((int(math.ceil(math.log10(data.yaxis_format.min_value))) / data.yaxis_format.tick) * data.yaxis_format.tick, int(math.floor(math.log10(data.yaxis_format.max_value))) + 1, data.yaxis_format.tick)])
-    elif data.yaxis_format.mode == "linear":
-        plt.yticks([data.yaxis_format.min_value + y * data.yaxis_format.tick for y in range(0, int((data.yaxis_format.max_value - data.yaxis_format.min_value) / data.yaxis_format.tick + 1))])
+    template = figure_pool.get(layout_key("categorybarchart", data), lambda: barchart_template(data, grid_zorder = -100))
+    ax = template.ax
 
-    # fig.get_frame().set_linewidth(data.figure_border_width)
-    plt.ylim(ymin = data.yaxis_format.min_value, ymax = data.yaxis_format.max_value)
-    plt.minorticks_on()
-    plt.gca().yaxis.grid(which = 'major', linestyle = '--', linewidth = data.major_grid_linewidth, dashes = data.major_grid_dashes, color = 'black', zorder = -100)
-    plt.gca().yaxis.grid(which = 'minor', linestyle = '--', linewidth = data.minor_grid_linewidth, dashes = data.minor_grid_dashes, color = 'black', zorder = -100)
-    for axis in ['top','bottom','left','right']:
-        plt.gca().spines[axis].set_linewidth(data.frame_border_width)
-
-    # get all categories
-    categories = []
-    labels = []
-    bar_dicts = {}
-    for bar in data.bars:
-        if not bar.category in categories:
-            categories.append(bar.category) # keep the order.
-        if not bar.label in labels:
-            labels.append(bar.label)
-            bar_dicts[bar.label] = {}
-        bar_dicts[bar.label][bar.category] = bar
-    # get all yvalue data
-    yvalues_labeled = []
-    yvalues_err_labeled = []
-    for label_index in range(0, len(labels)):
-        yvalues_labeled.append([bar_dicts[labels[label_index]][category].yvalue if category in bar_dicts[labels[label_index]] else 0.0 for category in categories])
-        yvalues_err_labeled.append([bar_dicts[labels[label_index]][category].yvalue_err if category in bar_dicts[labels[label_index]] else 0.0 for category in categories])
+    # get all categories and labels (in first-seen order) and the
+    # label x category matrices of values, the last bar of a pair winning
+    bars = PointTable.from_objects(data.bars)
+    categories = bars.category_names
+    labels = bars.label_names
+    label_codes = bars.column("label")
+    category_codes = bars.column("category")
+    # code -1 would index the last category
+    assert (category_codes >= 0).all(), 'every bar needs a category.'
+    yvalues_labeled = np.zeros((len(labels), len(categories)))
+    yvalues_labeled[label_codes, category_codes] = bars.column("yvalue")
+    yvalues_err_labeled = np.zeros((len(labels), len(categories)))
+    yvalues_err_labeled[label_codes, category_codes] = bars.column("yvalue_err")
+    yvalues_labeled = yvalues_labeled.tolist()
+    yvalues_err_labeled = yvalues_err_labeled.tolist()
 
     # count valid yvalues in each category
     xvalues_labeled = [[] for label_index in range(0, len(labels))]
@@ -485,23 +897,20 @@ def plot_categorybarchart(data, filename):
         yvalues = yvalues_labeled[label_index]
         yvalues_err = yvalues_err_labeled[label_index]
         xvalues = xvalues_labeled[label_index]
-        plt_bars = plt.bar(xvalues, yvalues, width = data.barwidth, align = 'center', linewidth = data.barlinewidth, label = labels[label_index], color = 'white', edgecolor = get_default_colors(data.color_indices[label_index]), hatch = get_default_hatches(data.hatch_indices[label_index]), zorder = 10)
-        plt.errorbar(xvalues, yvalues, yerr = [yvalues_err, yvalues_err], fmt = "none", ecolor = data.errorbar_color, elinewidth = data.errorbar_width, capsize = data.errorbar_capsize, capthick = data.errorbar_capthick, zorder = 20)
+        plt_bars = ax.bar(xvalues, yvalues, width = data.barwidth, align = 'center', linewidth = data.barlinewidth, label = labels[label_index], color = 'white', edgecolor = get_default_colors(data.color_indices[label_index]), hatch = get_default_hatches(data.hatch_indices[label_index]), zorder = 10)
+        ax.errorbar(xvalues, yvalues, yerr = [yvalues_err, yvalues_err], fmt = "none", ecolor = data.errorbar_color, elinewidth = data.errorbar_width, capsize = data.errorbar_capsize, capthick = data.errorbar_capthick, zorder = 20)
         # for bar_index in range(0, len(categories)):
         #     plt_bars[bar_index].set_color()
 
-    plt.xlim(xmin = -1, xmax = len(categories) * len(labels))
+    ax.set_xlim(-1, len(categories) * len(labels))
     # print xaxis
-    plt.xticks([(i + (len(labels) - 1.0) / (2.0 * len(labels))) * len(labels) for i in range(0, len(categories))], categories, rotation = data.xaxis_rotation)
-    # print yaxis
-    if data.yaxis_format.label != None and data.yaxis_format.label != "":
-        plt.ylabel(data.yaxis_format.label, fontsize = data.yaxis_format.font_size, labelpad = data.yaxis_format.labelpad)
+    ax.set_xticks([(i + (len(labels) - 1.0) / (2.0 * len(labels))) * len(labels) for i in range(0, len(categories))])
+    ax.set_xticklabels(categories, rotation = data.xaxis_rotation)
     # print legends
-    legend = plt.legend(loc = data.legend_location, frameon=True, fontsize = data.legend_fontsize, labelspacing = data.legend_labelspacing, ncol = data.legend_ncolumns)
+    legend = ax.legend(loc = data.legend_location, frameon=True, fontsize = data.legend_fontsize, labelspacing = data.legend_labelspacing, ncol = data.legend_ncolumns)
     legend.get_frame().set_linewidth(data.legend_border_width)
 
-    plt.savefig(filename, bbox_inches = 'tight', pad_inches = cm2in(0.1), dpi = 100)
-    plt.close(fig)
+    save_figure(template.fig, filename)
 
 # points = [DataPoint("a", 0, 1, 0.2), DataPoint("a", 1, 2, 0.5), DataPoint("a", 2, 2.4, 0.3), DataPoint("a", 3, 1.8, 0.3), DataPoint("b", 0, 4, 1.2), DataPoint("b", 1.2, 3, 0.3), DataPoint("b", 2.6, 2.1, 0.1)]
 # line_formats = {}